@@ -0,0 +1,221 @@
+"""
+Copyright 2026 Rob Weber
+
+This file is part of omni-epd
+
+omni-epd is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Benchmarks the VirtualEPD image pipeline using the omni_epd.mock display. Each pipeline stage,
+palette filtering and every dither algorithm is timed at the resolution of real displays in each mode.
+Building the frame buffer for 4 shade grayscale displays is also timed, with and without the gray4 stage.
+Results are saved as JSON so they can be compared between releases.
+
+Usage: python benchmarks/benchmark_pipeline.py --output results.json
+"""
+
+import argparse
+import json
+import os.path
+import platform
+import statistics
+import sys
+import time
+import types
+from importlib import import_module, metadata
+from PIL import Image
+from omni_epd import displayfactory
+from omni_epd.pipeline import ConvertStage, Gray4Stage
+from omni_epd.virtualepd import DITHER_MODES
+
+# resolutions of real displays, name is the display they come from
+RESOLUTIONS = {"waveshare_epd.epd2in13_V2": (250, 122),
+               "waveshare_epd.epd2in9_V2": (296, 128),
+               "waveshare_epd.epd4in2": (400, 300),
+               "inky.impression": (600, 448),
+               "waveshare_epd.epd7in5_V2": (800, 480),
+               "waveshare_epd.it8951": (1872, 1404)}
+
+# 4 shade grayscale displays and their driver width and height
+GRAY4_DISPLAYS = {"waveshare_epd.epd2in7": (176, 264),
+                  "waveshare_epd.epd3in7": (280, 480),
+                  "waveshare_epd.epd4in2": (400, 300)}
+
+# options used for each display mode
+MODES = {"bw": {},
+         "palette": {"palette_filter": "white, black, red, green, blue, yellow, orange"},
+         "color": {}}
+
+# each pipeline stage and the [Display] or [Image Enhancements] option that creates it
+STAGES = {"rotate": ("Display", {"rotate": "90"}),
+          "rotate_arbitrary": ("Display", {"rotate": "45"}),
+          "flip_horizontal": ("Display", {"flip_horizontal": "True"}),
+          "flip_vertical": ("Display", {"flip_vertical": "True"}),
+          "contrast": ("Image Enhancements", {"contrast": "1.5"}),
+          "brightness": ("Image Enhancements", {"brightness": "1.2"}),
+          "gamma": ("Image Enhancements", {"gamma": "1.8"}),
+          "contrast_brightness_gamma": ("Image Enhancements", {"contrast": "1.5", "brightness": "1.2", "gamma": "1.8"}),
+          "sharpness": ("Image Enhancements", {"sharpness": "2"})}
+
+# dither_args for the algorithms that need them
+DITHER_ARGS = {"bayer": "4,4",
+               "random": "-0.5,0.5",
+               "customordered": '{"matrix": [[12, 5, 6, 13], [4, 0, 1, 7], [11, 3, 2, 8], [15, 10, 9, 14]], "max": 16}',
+               "customdiffusion": "[[0, 0, 0.4375], [0.1875, 0.3125, 0.0625]]"}
+
+TEST_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", "PIA03519_small.jpg")
+
+
+def load_display(mode, size, section=None, options={}):
+    """ load the mock display with the given mode, size and options, it doesn't write any files """
+    config = {"EPD": {"mode": mode, "width": str(size[0]), "height": str(size[1]), "write_file": "False", **MODES[mode]}}
+
+    if (section is not None):
+        config[section] = options
+
+    return displayfactory.load_display_driver("omni_epd.mock", config)
+
+
+def option_stages(epd, image):
+    """ split the grey conversion, added to the pipeline in bw mode, from the stages created by the options
+    so only the stages for the option are timed
+
+    :returns: the image after the conversion and a list of the other stages
+    """
+    stages = []
+
+    for stage in epd._pipeline:
+        if (isinstance(stage, ConvertStage)):
+            image = stage.apply(image)
+        else:
+            stages.append(stage)
+
+    return image, stages
+
+
+def time_call(func, repeat):
+    """ run the function the given number of times
+
+    :returns: dict with the min, median and max run time in seconds
+    """
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return {"min": min(times), "median": statistics.median(times), "max": max(times), "runs": repeat}
+
+
+def run_benchmarks(modes, resolutions, dithers, engine, repeat):
+    """ time each stage, palette filtering and dither algorithm for every mode and resolution
+
+    :returns: a list of results
+    """
+    results = []
+
+    for name, size in resolutions.items():
+        image = Image.open(TEST_IMAGE).convert("RGB").resize(size)
+
+        for mode in modes:
+            def add_result(group, stage, timing):
+                results.append({"display": name, "width": size[0], "height": size[1], "mode": mode,
+                                "group": group, "stage": stage, **timing})
+                print(f"{name} {size[0]}x{size[1]} {mode} {group} {stage}: {timing['median'] * 1000:.1f}ms")
+
+            for stage, (section, options) in STAGES.items():
+                converted, stages = option_stages(load_display(mode, size, section, options), image)
+                add_result("pipeline", stage, time_call(lambda: [s.apply(converted) for s in stages], repeat))
+
+            epd = load_display(mode, size)
+            add_result("filter", "filter_image", time_call(lambda: epd._filterImage(image), repeat))
+
+            # images that already only have palette colors, like the output of dithering
+            dithered = epd._filterImage(image).convert("RGB")
+            add_result("filter", "filter_dithered", time_call(lambda: epd._filterImage(dithered), repeat))
+            add_result("display", "display", time_call(lambda: epd.display(image), repeat))
+
+            for dither in dithers:
+                epd = load_display(mode, size, "Display", {"dither": dither, "dither_args": DITHER_ARGS.get(dither, ""),
+                                                           "dither_engine": engine})
+                timing = time_call(lambda: epd._ditherImage(image, dither), repeat)
+                add_result("dither", dither, {**timing, "engine": "didder" if epd._ditherer is None else "builtin"})
+
+    return results
+
+
+def run_gray4_benchmarks(repeat):
+    """ time building the gray4 frame buffer: the driver getbuffer_4Gray() method when the waveshare_epd package is
+    installed, packing the processed image and converting to the display levels with the gray4 stage before packing
+
+    :returns: a list of results
+    """
+    from omni_epd.bufferpack import Gray4Packer
+
+    results = []
+
+    for name, size in GRAY4_DISPLAYS.items():
+        image = Image.open(TEST_IMAGE).convert("RGB").resize(size)
+        packer = Gray4Packer(size[0], size[1], False)
+        stage = Gray4Stage()
+
+        def add_result(stage_name, timing):
+            results.append({"display": name, "width": size[0], "height": size[1], "mode": "gray4",
+                            "group": "gray4", "stage": stage_name, **timing})
+            print(f"{name} {size[0]}x{size[1]} gray4 {stage_name}: {timing['median'] * 1000:.1f}ms")
+
+        try:
+            driver = getattr(import_module(name), "EPD")
+        except Exception:
+            # the Waveshare drivers need the Raspberry Pi libraries
+            driver = None
+
+        if (driver is not None):
+            # the driver method only needs the width and height
+            probe = types.SimpleNamespace(width=size[0], height=size[1])
+            add_result("driver", time_call(lambda: driver.getbuffer_4Gray(probe, image), repeat))
+
+        add_result("pack", time_call(lambda: packer.pack(image), repeat))
+        add_result("gray4_stage", time_call(lambda: packer.pack(stage.apply(image)), repeat))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Omni EPD Pipeline Benchmarks')
+    parser.add_argument('-o', '--output', default="benchmark_results.json", help="JSON file to save the results to")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="number of times to run each benchmark")
+    parser.add_argument('-m', '--modes', nargs='+', default=list(MODES), choices=list(MODES), help="display modes to test")
+    parser.add_argument('-s', '--sizes', nargs='+', default=list(RESOLUTIONS), choices=list(RESOLUTIONS), help="display resolutions to test")
+    parser.add_argument('-d', '--dithers', nargs='+', default=[d for d in DITHER_MODES if d != 'none'], choices=DITHER_MODES,
+                        help="dither algorithms to test")
+    parser.add_argument('-e', '--engine', default="auto", choices=["auto", "builtin", "didder"], help="dither_engine option to use")
+    args = parser.parse_args()
+
+    try:
+        version = metadata.version("omni_epd")
+    except metadata.PackageNotFoundError:
+        version = "unknown"
+
+    results = run_benchmarks(args.modes, {s: RESOLUTIONS[s] for s in args.sizes}, args.dithers, args.engine, args.repeat)
+    results += run_gray4_benchmarks(args.repeat)
+
+    with open(args.output, "w") as f:
+        json.dump({"omni_epd": version, "python": sys.version.split()[0], "platform": platform.platform(),
+                   "machine": platform.machine(), "engine": args.engine, "results": results}, f, indent=2)
+
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
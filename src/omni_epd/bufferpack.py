@@ -0,0 +1,324 @@
+"""
+Copyright 2026 Rob Weber
+
+This file is part of omni-epd
+
+omni-epd is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Builds the packed frame buffers sent to the Waveshare drivers with array operations instead of the per pixel
+loops in the driver getbuffer() methods. The buffer layout isn't the same for every driver, or every version
+of a driver, so find_packer() runs the driver method on small probe images and picks the packer that gives
+exactly the same bytes. If none of them match the driver method is used.
+"""
+
+import itertools
+import random
+import types
+import numpy as np
+from PIL import Image
+from . pipeline import gray4_code
+
+# colors used by the Waveshare drivers that send palette indexes (4 and 7 color displays)
+DRIVER_COLORS = ((0, 0, 0), (255, 255, 255), (0, 255, 0), (0, 0, 255), (255, 0, 0), (255, 255, 0), (255, 128, 0))
+
+# 2 bit code for each grey level, the same as the driver getbuffer_4Gray() methods: 192 and 128 are moved down a level
+GRAY4_CODES = np.array([gray4_code(v) for v in range(256)], dtype=np.uint8)
+
+# mono layouts used by the drivers, bits per pixel, the codes for white and black pixels and if row padding is set
+MONO_LAYOUTS = ((1, 1, 0, False), (1, 1, 0, True), (1, 0, 1, False), (1, 0, 1, True), (2, 3, 0, False), (4, 3, 0, False))
+
+# swaps 0 and 1 bits, for drivers where 1 is black
+INVERT_TABLE = bytes(255 - i for i in range(256))
+
+
+def pack_codes(codes, bits):
+    """ pack an array of codes into bytes, first code in the most significant bits
+    :param codes: a uint8 array, its size must be a multiple of the codes per byte
+    :param bits: bits per code, 2 or 4
+
+    :returns: the packed bytes
+    """
+    per_byte = 8 // bits
+    codes = codes.reshape(-1, per_byte)
+
+    result = codes[:, 0] << (8 - bits)
+    for i in range(1, per_byte):
+        result |= codes[:, i] << (8 - bits * (i + 1))
+
+    return result.tobytes()
+
+
+def unpack_codes(data, bits):
+    """ unpack bytes created by pack_codes()
+    :param data: the packed bytes
+    :param bits: bits per code, 2 or 4
+
+    :returns: a uint8 array of codes
+    """
+    data = np.frombuffer(bytes(data), dtype=np.uint8)
+
+    return np.stack([(data >> (8 - bits * (i + 1))) & ((1 << bits) - 1) for i in range(8 // bits)], axis=1).ravel()
+
+
+class BufferPacker:
+    """
+    Builds the frame buffer for a display. Like the drivers, images must be the display size
+    or rotated 90 degrees (height x width), these are turned counter clockwise
+    """
+
+    def __init__(self, width, height):
+        """
+        :param width: display width from the driver
+        :param height: display height from the driver
+        """
+        self.width = width
+        self.height = height
+        self.rotated = True  # if rotated images can be packed, False when the driver doesn't accept them
+
+    def _orient(self, image):
+        """ returns True if the image needs to be rotated, None if it isn't a valid size """
+        if (image.size == (self.width, self.height)):
+            return False
+        elif (self.rotated and image.size == (self.height, self.width)):
+            return True
+
+        return None
+
+    def pack(self, image):
+        """ build the buffer for an image
+        :param image: an Image object
+
+        :returns: the buffer as bytes, or None if the image isn't the display size
+        """
+        raise NotImplementedError
+
+
+class MonoPacker(BufferPacker):
+    """ 1 bit images, each pixel is sent as 1, 2 or 4 bits """
+
+    def __init__(self, width, height, bits, white, black, rotate_first, pad=False):
+        """
+        :param bits: bits per pixel
+        :param white: code for white pixels
+        :param black: code for black pixels
+        :param rotate_first: rotate the image before converting it to 1 bit, this changes the dithering
+        :param pad: set the unused bits at the end of each row, when the width isn't a multiple of 8
+        """
+        super().__init__(width, height)
+        self.bits = bits
+        self.white = white
+        self.black = black
+        self.rotate_first = rotate_first
+        self.pad = pad
+
+    def pack(self, image):
+        rotate = self._orient(image)
+
+        if (rotate is None):
+            return None
+        elif (rotate and self.rotate_first):
+            image = image.rotate(90, expand=True).convert('1')
+        elif (rotate):
+            image = image.convert('1').rotate(90, expand=True)
+        else:
+            image = image.convert('1')
+
+        if (self.bits == 1):
+            # Pillow packs 1 bit images the same way, 1 is white and rows are padded with 0
+            result = image.tobytes()
+            result = result if self.white == 1 else result.translate(INVERT_TABLE)
+
+            if (self.pad and image.width % 8):
+                rows = np.frombuffer(result, dtype=np.uint8).reshape(image.height, -1).copy()
+                rows[:, -1] |= (1 << (8 - image.width % 8)) - 1
+                result = rows.tobytes()
+
+            return result
+
+        if (image.width % (8 // self.bits)):
+            return None
+
+        return pack_codes(np.where(np.asarray(image), self.white, self.black).astype(np.uint8), self.bits)
+
+
+class Gray4Packer(BufferPacker):
+    """ 4 shade grayscale images, 2 bits per pixel """
+
+    def __init__(self, width, height, transpose):
+        """
+        :param transpose: rotated images are transposed instead of turned, some drivers do this
+        """
+        super().__init__(width, height)
+        self.transpose = transpose
+
+    def pack(self, image):
+        rotate = self._orient(image)
+
+        if (rotate is None or image.width % 4):
+            return None
+
+        pixels = np.asarray(image if image.mode == 'L' else image.convert('L'))
+
+        if (rotate):
+            pixels = pixels.T if self.transpose else np.rot90(pixels)
+
+        return pack_codes(GRAY4_CODES[pixels], 2)
+
+
+class IndexedPacker(BufferPacker):
+    """ images sent as the palette index of each pixel, 2 or 4 bits per pixel """
+
+    def __init__(self, width, height, colors, bits, exact):
+        """
+        :param colors: the color for each palette index
+        :param bits: bits per pixel
+        :param exact: only colors in the palette are used and all others are index 0, otherwise the image is quantized
+        """
+        super().__init__(width, height)
+        self.bits = bits
+        self.exact = exact
+
+        # palette used for quantizing, indexes not used by the driver are black
+        self.palette_image = Image.new('P', (1, 1))
+        self.palette_image.putpalette([c for color in colors for c in color] + [0, 0, 0] * (256 - len(colors)))
+
+        # RGB value -> index lookup for exact colors
+        keys = np.array([(r << 16) | (g << 8) | b for r, g, b in colors], dtype=np.int64)
+        self.keys, first = np.unique(keys, return_index=True)
+        self.indexes = first.astype(np.uint8)
+
+    def pack(self, image):
+        rotate = self._orient(image)
+
+        if (rotate is None or (image.width * image.height) % (8 // self.bits)):
+            return None
+
+        if (rotate):
+            image = image.rotate(90, expand=True)
+
+        image = image.convert('RGB')
+
+        if (not self.exact):
+            return pack_codes(np.asarray(image.quantize(palette=self.palette_image)), self.bits)
+
+        pixels = np.asarray(image).astype(np.int64)
+        keys = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+
+        found = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        codes = np.where(self.keys[found] == keys, self.indexes[found], 0).astype(np.uint8)
+
+        return pack_codes(codes, self.bits)
+
+
+def __probe_images(width, height):
+    """ random images with the driver colors and every grey level, for both orientations """
+    rand = random.Random(8)
+    colors = list(DRIVER_COLORS) + [(v, v, v) for v in range(256)]
+
+    result = []
+    for size in ((width, height), (height, width)):
+        image = Image.new('RGB', size)
+        image.putdata([rand.choice(colors) if rand.random() < 0.5 else tuple(rand.randrange(256) for _ in range(3))
+                       for _ in range(size[0] * size[1])])
+        result.append(image)
+
+    return result
+
+
+def __find_colors(func, driver):
+    """ find the palette index the driver uses for each of the DRIVER_COLORS, colors the driver doesn't
+    use are mapped to the nearest one so when more than one color has the same index each is tried
+
+    :returns: a list of (bits, colors) for each possible palette
+    """
+    image = Image.new('RGB', (driver.width, driver.height))
+    image.putdata([DRIVER_COLORS[i % len(DRIVER_COLORS)] for i in range(driver.width * driver.height)])
+    data = func(driver, image)
+
+    result = []
+    for bits in (2, 4):
+        if (len(data) * 8 // bits != driver.width * driver.height):
+            continue
+
+        found = {}  # index -> colors
+        for i, code in enumerate(unpack_codes(data, bits)):
+            color = DRIVER_COLORS[i % len(DRIVER_COLORS)]
+            if (color not in found.setdefault(int(code), [])):
+                found[int(code)].append(color)
+
+        for choice in itertools.product(*found.values()):
+            colors = [(0, 0, 0)] * (1 << bits)
+            for code, color in zip(found, choice):
+                colors[code] = color
+
+            result.append((bits, colors))
+
+    return result
+
+
+def find_packer(driver, method="getbuffer"):
+    """ find a packer that builds exactly the same buffers as a Waveshare driver method. The driver method is
+    run on small probe images, with a stand in for the driver that has the same size as the probes
+    :param driver: the Waveshare driver object, this needs width and height attributes
+    :param method: the driver method to replace, getbuffer or getbuffer_4Gray
+
+    :returns: a function that takes an Image and returns the buffer, or None if the image isn't the display size.
+    None if no packer matches the driver
+    """
+    func = getattr(type(driver), method, None)
+    if (func is None):
+        return None
+
+    # keep the same remainders as the display size so row padding is the same
+    probe = types.SimpleNamespace(width=16 + driver.width % 16, height=8 + driver.height % 8)
+
+    try:
+        if (method == "getbuffer_4Gray"):
+            candidates = [Gray4Packer(probe.width, probe.height, t) for t in (False, True)]
+        else:
+            candidates = [MonoPacker(probe.width, probe.height, bits, white, black, r, pad)
+                          for bits, white, black, pad in MONO_LAYOUTS for r in (True, False)]
+            candidates += [IndexedPacker(probe.width, probe.height, colors, bits, exact)
+                           for bits, colors in __find_colors(func, probe) for exact in (False, True)]
+
+        images = __probe_images(probe.width, probe.height)
+        results = [func(probe, images[0])]
+        expected = [bytes(results[0])]
+    except Exception:
+        # the driver needs more than a width and height, or doesn't return bytes
+        return None
+
+    try:
+        results.append(func(probe, images[1]))
+        expected.append(bytes(results[1]))
+    except Exception:
+        # the driver doesn't accept rotated images, leave these to the driver
+        images = images[:1]
+
+    for packer in candidates:
+        packer.rotated = len(images) > 1
+
+        if (all(packer.pack(image) == e for image, e in zip(images, expected))):
+            # same packer for the real display size, returning the same type as the driver
+            packer.width = driver.width
+            packer.height = driver.height
+            result_type = list if isinstance(results[0], list) else bytearray
+
+            def pack(image, packer=packer):
+                result = packer.pack(image)
+                return result_type(result) if result is not None else None
+
+            return pack
+
+    return None
@@ -18,6 +18,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 """
 
+import functools
 import importlib.util
 import sys
 
@@ -30,7 +31,8 @@ IMAGE_DISPLAY = "Display"
 IMAGE_ENHANCEMENTS = "Image Enhancements"
 
 
-# helper method to check if a module is (or can be) installed
+# helper method to check if a module is (or can be) installed, the result is cached
+@functools.lru_cache(maxsize=None)
 def check_module_installed(moduleName):
     result = False
 
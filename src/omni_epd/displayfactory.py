@@ -22,12 +22,46 @@ import configparser
 import importlib
 import os
 import logging
+import threading
 from . errors import EPDNotFoundError, EPDConfigurationError
 from . conf import CONFIG_FILE, EPD_CONFIG
 from . virtualepd import VirtualEPD
-from . displays.mock_display import MockDisplay  # noqa: F401
-from . displays.waveshare_display import WaveshareDisplay  # noqa: F401
-from . displays.inky_display import InkyDisplay  # noqa: F401
+
+# modules with the display classes for each device package, these are only imported
+# when a device from that package is loaded or all displays are listed
+DISPLAY_MODULES = {"omni_epd": ("omni_epd.displays.mock_display", ),
+                   "waveshare_epd": ("omni_epd.displays.waveshare_display", ),
+                   "inky": ("omni_epd.displays.inky_display", )}
+
+# registry of supported devices, built up once per process as display modules are imported
+__registry = {}  # device name (pkg.device) -> display class
+__registered = {}  # display class -> list of supported devices
+__imported = set()  # packages in DISPLAY_MODULES already imported
+
+__config_cache = {}  # config file path -> ((mtime, size), contents)
+
+
+def __read_config_file(path):
+    """
+    Read a config file, the contents are cached by path and only read again
+    when the modification time or size of the file changes
+
+    :returns: the contents of the file, or None if it doesn't exist
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = __config_cache.get(path)
+
+    if (cached is None or cached[0] != key):
+        with open(path) as f:
+            cached = (key, f.read())
+        __config_cache[path] = cached
+
+    return cached[1]
 
 
 def __loadConfig(deviceName):
@@ -36,8 +70,9 @@ def __loadConfig(deviceName):
     config = configparser.ConfigParser()
 
     # check for global ini file
-    if (os.path.exists(os.path.join(os.getcwd(), CONFIG_FILE))):
-        config.read(os.path.join(os.getcwd(), CONFIG_FILE))
+    contents = __read_config_file(os.path.join(os.getcwd(), CONFIG_FILE))
+    if (contents is not None):
+        config.read_string(contents, CONFIG_FILE)
         logger.debug(f"Loading {CONFIG_FILE}")
 
     # possible device name exists in global configuration file
@@ -45,8 +80,9 @@ def __loadConfig(deviceName):
         deviceName = config.get(EPD_CONFIG, 'type')
 
     # check for device specific ini file
-    if (deviceName and os.path.exists(os.path.join(os.getcwd(), f"{deviceName}.ini"))):
-        config.read(os.path.join(os.getcwd(), f"{deviceName}.ini"))
+    contents = __read_config_file(os.path.join(os.getcwd(), f"{deviceName}.ini")) if deviceName else None
+    if (contents is not None):
+        config.read_string(contents, f"{deviceName}.ini")
         logger.debug(f"Loading {deviceName}.ini")
 
     return config
@@ -66,23 +102,53 @@ def __get_subclasses(cName):
     return result
 
 
-def list_supported_displays(as_dict=False):
-    result = []
+def __import_display_modules(packages):
+    """
+    Import the modules with the display classes for the given device packages
+    so they're found as subclasses of VirtualEPD, each package is only imported once
+    """
+    for pkg in packages:
+        if (pkg not in __imported):
+            __imported.add(pkg)
+
+            for modName in DISPLAY_MODULES.get(pkg, ()):
+                importlib.import_module(modName)
+
+
+def __register_displays():
+    """
+    Add display classes that aren't in the registry yet, get_supported_devices()
+    is only called once for each class
+    """
+    for cls in __get_subclasses(VirtualEPD):
+        if (cls not in __registered):
+            __registered[cls] = cls.get_supported_devices()
+
+            for device in __registered[cls]:
+                __registry.setdefault(device, cls)
+
+
+def __find_display_class(displayName):
+    """
+    Find the class that supports the given display name, only the modules
+    for the package of this display are imported
+    """
+    if (displayName not in __registry):
+        __import_display_modules([displayName.split('.')[0]])
+        __register_displays()
+
+    return __registry.get(displayName)
 
-    # get a list of display classes extending VirtualEPD
-    displayClasses = [(cls.__module__, cls.__name__) for cls in __get_subclasses(VirtualEPD)]
 
-    for modName, className in displayClasses:
-        # load the module the class belongs to
-        mod = importlib.import_module(modName)
-        # get the class
-        classObj = getattr(mod, className)
+def list_supported_displays(as_dict=False):
+    # all display modules are needed to list every display
+    __import_display_modules(DISPLAY_MODULES)
+    __register_displays()
 
-        if (as_dict):
-            result.append({'package': modName, 'class': className, 'devices': classObj.get_supported_devices()})
-        else:
-            # add supported devices of this class
-            result = sorted(result + classObj.get_supported_devices())
+    if (as_dict):
+        result = [{'package': cls.__module__, 'class': cls.__name__, 'devices': list(devices)} for cls, devices in __registered.items()]
+    else:
+        result = sorted(__registry)
 
     return result
 
@@ -98,26 +164,66 @@ def load_display_driver(displayName='', configDict={}):
     if (not displayName and config.has_option(EPD_CONFIG, 'type')):
         displayName = config.get(EPD_CONFIG, 'type')
 
-    # get a dict of all valid display device classes
-    displayClasses = list_supported_displays(True)
-    foundClass = list(filter(lambda d: displayName in d['devices'], displayClasses))
+    # find the display class, this only imports the module for this type of display
+    classObj = __find_display_class(displayName)
 
-    if (len(foundClass) == 1):
+    if (classObj is not None):
         # split on the pkg.classname
         deviceType = displayName.split('.')
 
         # create the class and initialize
-        mod = importlib.import_module(foundClass[0]['package'])
-        classObj = getattr(mod, foundClass[0]['class'])
-
         result = classObj(deviceType[1], config)
 
         # check that the display mode is valid - must be done after class loaded
         if (result.mode not in result.modes_available):
             raise EPDConfigurationError(displayName, "mode", result.mode)
 
+        # parse the image processing options once, this also validates them
+        result.compile_pipeline()
+
     else:
         # we have a problem
         raise EPDNotFoundError(displayName)
 
     return result
+
+
+def reload_config(epd, configDict={}):
+    """
+    Read the config files again for a display that's already loaded and apply any changes
+    to the [Display] and [Image Enhancements] options. The display isn't reopened.
+
+    :param epd: a display returned by load_display_driver()
+    :param configDict: the configDict passed to load_display_driver(), if any
+    :raises EPDConfigurationError: if a changed option is invalid, the current options are kept
+    :returns: True if the options changed
+    """
+    config = __loadConfig(str(epd))
+    config.read_dict(configDict)
+
+    return epd.apply_config(config)
+
+
+def watch_config(epd, configDict={}, interval=5):
+    """
+    Start a background thread that calls reload_config() for the display every interval seconds,
+    invalid changes are logged and ignored. Changes are applied between calls to display()
+
+    :param epd: a display returned by load_display_driver()
+    :param configDict: the configDict passed to load_display_driver(), if any
+    :param interval: seconds between checks of the config files
+    :returns: a threading.Event, set it to stop watching
+    """
+    logger = logging.getLogger(__name__)
+    stop = threading.Event()
+
+    def watch():
+        while (not stop.wait(interval)):
+            try:
+                reload_config(epd, configDict)
+            except EPDConfigurationError as e:
+                logger.error(f"Configuration not reloaded: {e}")
+
+    threading.Thread(target=watch, name=f"{epd} config watcher", daemon=True).start()
+
+    return stop
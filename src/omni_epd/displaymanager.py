@@ -0,0 +1,136 @@
+"""
+Copyright 2026 Rob Weber
+
+This file is part of omni-epd
+
+omni-epd is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import concurrent.futures
+import logging
+from . errors import EPDUpdateError
+
+
+class DisplayManager:
+    """
+    Updates several displays at the same time. Each display is run on its own worker thread so the
+    total time is the time of the slowest display instead of the sum of all of them.
+    Every method waits until all the displays are done. If a display fails the others are still updated
+    and an EPDUpdateError is raised at the end with the error for each display that failed
+    """
+
+    def __init__(self, displays, frame_cache=None):
+        """
+        :param displays: a dict of name -> VirtualEPD, the names are used for the results and errors
+        :param frame_cache: a FrameCache shared by all the displays, so displays with the same settings only process an image once
+        """
+        self.displays = dict(displays)
+
+        if (frame_cache is not None):
+            for epd in self.displays.values():
+                epd.set_frame_cache(frame_cache)
+
+        self._logger = logging.getLogger(__name__)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(len(self.displays), 1),
+                                                               thread_name_prefix="DisplayManager")
+
+    def __run(self, func, names):
+        """ run func(name, epd) for each of the given displays in parallel and wait for all of them
+        :param func: the function to run for each display
+        :param names: the names of the displays to run it on
+
+        :raises EPDUpdateError: if any of the displays raised an error, after all of them are done
+        :returns: a dict of name -> return value of func
+        """
+        futures = {name: self._executor.submit(func, name, self.displays[name]) for name in names}
+        concurrent.futures.wait(futures.values())
+
+        results = {}
+        errors = {}
+        for name, future in futures.items():
+            if (future.exception() is None):
+                results[name] = future.result()
+            else:
+                errors[name] = future.exception()
+                self._logger.error(f"{name} failed: {errors[name]}")
+
+        if (errors):
+            raise EPDUpdateError(errors, results)
+
+        return results
+
+    def __images(self, images):
+        """ an Image is sent to every display, a dict of name -> Image to only the displays named """
+        return images if isinstance(images, dict) else dict.fromkeys(self.displays, images)
+
+    def prepare(self):
+        """ run prepare() on every display
+
+        :returns: a dict of name -> result of prepare()
+        """
+        return self.__run(lambda name, epd: epd.prepare(), self.displays)
+
+    def display(self, images, force=False):
+        """ draw images on the displays, configured effects are applied on the worker threads
+        :param images: an Image object to draw on every display, or a dict of name -> Image
+        :param force: draw the images even if skip_unchanged is set and they match the last image
+
+        :returns: a dict of name -> True if the image was drawn, False if it was skipped
+        """
+        images = self.__images(images)
+
+        return self.__run(lambda name, epd: epd.display(images[name], force), images)
+
+    def update(self, images, force=False):
+        """ run prepare(), display() and sleep() on each display, a display stops at the first step that fails
+        :param images: an Image object to draw on every display, or a dict of name -> Image
+        :param force: draw the images even if skip_unchanged is set and they match the last image
+
+        :returns: a dict of name -> True if the image was drawn, False if it was skipped
+        """
+        images = self.__images(images)
+
+        def update(name, epd):
+            epd.prepare()
+            result = epd.display(images[name], force)
+            epd.sleep()
+
+            return result
+
+        return self.__run(update, images)
+
+    def sleep(self):
+        """ run sleep() on every display
+
+        :returns: a dict of name -> result of sleep()
+        """
+        return self.__run(lambda name, epd: epd.sleep(), self.displays)
+
+    def clear(self):
+        """ run clear() on every display
+
+        :returns: a dict of name -> result of clear()
+        """
+        return self.__run(lambda name, epd: epd.clear(), self.displays)
+
+    def close(self):
+        """ run close() on every display, the worker threads are stopped once they're done
+
+        :returns: a dict of name -> result of close()
+        """
+        try:
+            return self.__run(lambda name, epd: epd.close(), self.displays)
+        finally:
+            self._executor.shutdown()
@@ -17,7 +17,6 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 """
-from inky.inky_uc8159 import DESATURATED_PALETTE
 from PIL import Image
 from .. virtualepd import VirtualEPD
 from .. conf import check_module_installed
@@ -54,7 +53,7 @@ class InkyDisplay(VirtualEPD):
         elif (self.mode == dColor == "yellow"):
             self.palette_filter.append([255, 255, 0])
         elif (self.mode == dColor == "color"):
-            self.palette_filter = DESATURATED_PALETTE
+            self.palette_filter = self.load_display_driver(self.pkg_name, 'inky_uc8159').DESATURATED_PALETTE
 
         # set the width and height
         self.width = self._device.width
@@ -108,6 +107,8 @@ class InkyDisplay(VirtualEPD):
         self._device.show()
 
     def clear(self):
+        self._reset_refresh()
+
         clear_image = Image.new("P", (self.width, self.height), self.clear_color)
         self._device.set_image(clear_image)
         self._device.show()
@@ -91,6 +91,7 @@ class MockDisplay(VirtualEPD):
         self.logger.info(f"{self.__str__()} is sleeping")
 
     def clear(self):
+        self._reset_refresh()
         self.logger.info(f"clearing {self.__str__()}")
 
     def close(self):
@@ -18,13 +18,36 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 """
 
+import functools
 from .. virtualepd import VirtualEPD
 from .. conf import check_module_installed
-from PIL import Image
+from .. errors import EPDConfigurationError
+from .. refresh import REFRESH_FULL, REFRESH_PARTIAL
+from .. pipeline import Gray4Stage, GRAY4_LEVELS
+from PIL import Image, ImageChops
 
 
 WAVESHARE_PKG = "waveshare_epd"
 
+# IT8951 waveforms for black and white areas, DU is faster than GC16, A2 is the fastest but ghosts more
+IT8951_FAST_WAVEFORMS = ("DU", "A2")
+
+
+@functools.lru_cache(maxsize=None)
+def tricolor_plane_tables(palette):
+    """ lookup tables that split a palette image into the black and color planes for a 3 color display.
+    Colors are sorted by their grey level, darker than 20 is black, lighter than 235 is white and the
+    rest is the third color. Each table maps a palette index to 0 (ink) or 255 (no ink)
+    :param palette: a Palette object
+
+    :returns: a tuple of the black plane table and the color plane table
+    """
+    # grey level of each palette index, the same as Image.convert('L'), unused indexes are black
+    colors = list(palette.colors) + [(0, 0, 0)] * (256 - len(palette))
+    greys = [(r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16 for r, g, b in colors]
+
+    return ([255 if p >= 20 else 0 for p in greys], [0 if 20 < p < 235 else 255 for p in greys])
+
 
 class WaveshareDisplay(VirtualEPD):
     """
@@ -50,6 +73,33 @@ class WaveshareDisplay(VirtualEPD):
         self.width = self._device.width
         self.height = self._device.height
 
+        # frame buffers are packed here instead of by the driver when a packer gives the same result, see _getbuffer()
+        self._fast_buffer = self._getboolean_device_option('fast_buffer', True)
+        self._packers = {}  # driver method name -> packer function, or None to use the driver
+
+    def _getbuffer(self, image, method="getbuffer"):
+        """ build the frame buffer for an image. This gives exactly the same buffer as the driver method
+        but uses array operations when a packer matching the driver is found, driver methods often loop over each pixel
+        :param image: an Image object
+        :param method: the driver method, getbuffer or getbuffer_4Gray
+
+        :returns: the buffer to pass to the driver display methods
+        """
+        if (method not in self._packers):
+            self._packers[method] = None
+
+            if (self._fast_buffer):
+                from .. import bufferpack
+
+                self._packers[method] = bufferpack.find_packer(self._device, method)
+                self._logger.debug(f"{method} {'packed by omni-epd' if self._packers[method] else 'done by driver'}")
+
+        result = None
+        if (self._packers[method] is not None):
+            result = self._packers[method](image)
+
+        return result if result is not None else getattr(self._device, method)(image)
+
     @staticmethod
     def get_supported_devices():
         # this class is meant to be abstract but will be called by displayfactory, return nothing
@@ -65,6 +115,7 @@ class WaveshareDisplay(VirtualEPD):
         """
         Most devices utilize the same clear function
         """
+        self._reset_refresh()
         self._device.Clear()
 
     def close(self):
@@ -99,6 +150,15 @@ class WaveshareBWDisplay(WaveshareDisplay):
                  "epd7in5_HD": {"alt_init": False, "lut_init": False, "alt_clear": False, "version": 1},
                  "epd7in5_V2": {"alt_init": False, "lut_init": False, "alt_clear": False, "version": 2}}
 
+    # devices with a partial update method that takes the full frame buffer
+    # init = param passed to init() before a partial update, base = full update method that also sets the partial base image
+    partialMap = {"epd1in54_V2": {"init": 1, "base": "displayPartBaseImage", "display": "displayPart"},
+                  "epd2in9_V2": {"base": "display_Base", "display": "display_Partial"},
+                  "epd2in9d": {"display": "DisplayPartial"},
+                  "epd2in13_V2": {"init": 1, "base": "displayPartBaseImage", "display": "displayPartial"},
+                  "epd2in13_V3": {"base": "displayPartBaseImage", "display": "displayPartial"},
+                  "epd2in13d": {"display": "DisplayPartial"}}
+
     alt_init_param = 0  # the parameter to pass to init - specifies update mode (full vs partial)
 
     def __init__(self, deviceName, config):
@@ -110,6 +170,15 @@ class WaveshareBWDisplay(WaveshareDisplay):
         if (self.deviceMap[deviceName]['lut_init']):
             self.alt_init_param = self._device.lut_full_update
 
+        # the refresh policy picks partial updates when partial_update is set and the changed area is small enough
+        self._partial = self.partialMap.get(deviceName)
+        self._partial_mode = False  # if the device was last set up for partial updates
+
+        if (self._partial is not None):
+            self.refresh_types = (REFRESH_FULL, REFRESH_PARTIAL)
+        elif (self._refresh_policy.partial_update):
+            self._logger.warning(f"{self.getName()} doesn't support partial updates, using full updates")
+
     @staticmethod
     def get_supported_devices():
         result = []
@@ -129,10 +198,29 @@ class WaveshareBWDisplay(WaveshareDisplay):
             self._device.init()
 
     def _display(self, image):
-        # no need to adjust palette, done in waveshare driver
-        self._device.display(self._device.getbuffer(image))
+        if (self._partial is None or not self._refresh_policy.partial_update):
+            # no need to adjust palette, done in waveshare driver
+            self._device.display(self._getbuffer(image))
+            return
+
+        # go back to full update mode
+        if (self._partial_mode and "init" in self._partial):
+            self.prepare()
+
+        # also sets the base image for the next partial updates
+        getattr(self._device, self._partial.get("base", "display"))(self._getbuffer(image))
+        self._partial_mode = False
+
+    def _display_partial(self, image):
+        if ("init" in self._partial):
+            self._device.init(self._partial["init"])
+
+        getattr(self._device, self._partial["display"])(self._getbuffer(image))
+        self._partial_mode = True
 
     def clear(self):
+        self._reset_refresh()
+
         if (self.deviceMap[self._device_name]['alt_clear']):
             # device needs color parameter, hardcode white
             self._device.Clear(0xFF)
@@ -187,6 +275,8 @@ class WaveshareTriColorDisplay(WaveshareDisplay):
         elif (self.mode == 'yellow'):
             self.palette_filter.append([255, 255, 0])
 
+        self._blank_plane = None  # buffer of the empty second plane used in bw mode, created on first use
+
     @staticmethod
     def get_supported_devices():
         result = []
@@ -204,24 +294,23 @@ class WaveshareTriColorDisplay(WaveshareDisplay):
 
         if (self.mode == 'bw'):
             # send the black/white image and blank second image (safer since some drivers require data)
-            img_white = Image.new('1', (self._device.height, self._device.width), 255)
-            self._device.display(self._device.getbuffer(image), self._device.getbuffer(img_white))
+            if (self._blank_plane is None):
+                self._blank_plane = self._getbuffer(Image.new('1', (self._device.height, self._device.width), 255))
+
+            # pass a copy, some drivers invert the buffers they're given in place
+            self._device.display(self._getbuffer(image), self._blank_plane[:])
         else:
             # apply the color filter to get a 3 color image
             image = self._filterImage(image)
 
-            # convert to greyscale
-            image = image.convert('L')
-
-            # convert greys to black or white based on threshold of 20
+            # map the palette indexes straight to 1 bit black and color planes (third color is black in its plane)
             # https://pillow.readthedocs.io/en/stable/reference/Image.html#PIL.Image.Image.point
-            img_black = image.point(lambda p: 255 if p >= 20 else 0)
-
-            # convert greys to third color (represented as black in the image) or white based on threshold of 20
-            img_color = image.point(lambda p: 0 if 20 < p < 235 else 255)
+            black_table, color_table = tricolor_plane_tables(self._get_palette())
+            img_black = image.point(black_table, '1')
+            img_color = image.point(color_table, '1')
 
             # send to display
-            self._device.display(self._device.getbuffer(img_black), self._device.getbuffer(img_color))
+            self._device.display(self._getbuffer(img_black), self._getbuffer(img_color))
 
 
 class WaveshareQuadColorDisplay(WaveshareDisplay):
@@ -273,7 +362,7 @@ class WaveshareQuadColorDisplay(WaveshareDisplay):
             image = self._filterImage(image)
 
         # send to display
-        self._device.display(self._device.getbuffer(image))
+        self._device.display(self._getbuffer(image))
 
 
 class WaveshareGrayscaleDisplay(WaveshareDisplay):
@@ -295,6 +384,10 @@ class WaveshareGrayscaleDisplay(WaveshareDisplay):
 
         # device object created in parent class
 
+        if (self.mode == "gray4"):
+            # dither to the grey levels of the display
+            self.palette_filter = [[v, v, v] for v in GRAY4_LEVELS]
+
     @staticmethod
     def get_supported_devices():
         result = []
@@ -311,14 +404,19 @@ class WaveshareGrayscaleDisplay(WaveshareDisplay):
         else:
             self._device.init()
 
+    def _get_device_stages(self):
+        # images are reduced to the 4 grey levels in the pipeline so the buffer can be packed directly
+        return [Gray4Stage()] if self.mode == "gray4" else []
+
     def _display(self, image):
-        # no need to adjust image, done in waveshare lib
         if (self.mode == "gray4"):
-            self._device.display_4Gray(self._device.getbuffer_4Gray(image))
+            self._device.display_4Gray(self._getbuffer(image, "getbuffer_4Gray"))
         else:
-            self._device.display(self._device.getbuffer(image))
+            self._device.display(self._getbuffer(image))
 
     def clear(self):
+        self._reset_refresh()
+
         if (self.deviceMap[self._device_name]['alt_clear']):
             self._device.Clear(0xFF)  # use white for clear
         else:
@@ -345,6 +443,9 @@ class Waveshare3in7Display(WaveshareDisplay):
         self.width = self._device.height
         self.height = self._device.width
 
+        # dither to the grey levels of the display
+        self.palette_filter = [[v, v, v] for v in GRAY4_LEVELS]
+
     @staticmethod
     def get_supported_devices():
         result = []
@@ -358,11 +459,15 @@ class Waveshare3in7Display(WaveshareDisplay):
         # 3.7 in has different init methods
         self._device.init(0)
 
+    def _get_device_stages(self):
+        return [Gray4Stage()]
+
     def _display(self, image):
-        # no need to adjust image, done in waveshare lib
-        self._device.display_4Gray(self._device.getbuffer_4Gray(image))
+        self._device.display_4Gray(self._getbuffer(image, "getbuffer_4Gray"))
 
     def clear(self):
+        self._reset_refresh()
+
         # 3.7 in needs mode and color to clear
         self._device.Clear(0xFF, 0)
 
@@ -391,13 +496,15 @@ class Waveshare102inDisplay(WaveshareDisplay):
         self._device.Init()
 
     def _display(self, image):
-        self._device.display(self._device.getbuffer(image))
+        self._device.display(self._getbuffer(image))
 
     def sleep(self):
         # this differs from parent
         self._device.Sleep()
 
     def clear(self):
+        self._reset_refresh()
+
         # this differs from parent
         self._device.Clear()
 
@@ -438,7 +545,7 @@ class WaveshareMultiColorDisplay(WaveshareDisplay):
         if (self.mode == 'bw'):
             image = self._filterImage(image)
 
-        self._device.display(self._device.getbuffer(image))
+        self._device.display(self._getbuffer(image))
 
 
 class IT8951Display(VirtualEPD):
@@ -451,6 +558,7 @@ class IT8951Display(VirtualEPD):
 
     max_colors = 16
     modes_available = ('bw', 'gray16')
+    refresh_types = (REFRESH_FULL, REFRESH_PARTIAL)  # partial updates only redraw the area that changed
 
     it8951_pkg_name = 'IT8951'
     it8951_constants = None
@@ -471,6 +579,12 @@ class IT8951Display(VirtualEPD):
         # load the from IT8951.constants
         self.it8951_constants = self.load_display_driver(self.it8951_pkg_name, "constants")
 
+        waveform = self._get_device_option('fast_waveform', 'DU').upper()
+        if (waveform not in IT8951_FAST_WAVEFORMS):
+            raise EPDConfigurationError(self.getName(), "fast_waveform", waveform)
+
+        self._fast_waveform = getattr(self.it8951_constants.DisplayModes, waveform)
+
     @staticmethod
     def get_supported_devices():
         # same type for all it8951 displays
@@ -479,23 +593,50 @@ class IT8951Display(VirtualEPD):
     def prepare(self):
         self._device.epd.run()
 
-    def _display(self, image):
+    def __frame(self, image):
+        """ create the display sized frame for an image, the area not covered by the image is white
+        :param image: an Image object
+
+        :returns: an L mode Image object the size of the display
+        """
         if (self.mode == 'bw'):
             image = self._filterImage(image)
 
-        self.clear()  # not sure if this is needed, was part of example
-
         dims = (self.width, self.height)
-        image.thumbnail(dims)
+        if (image.size != dims):
+            image = image.copy()
+            image.thumbnail(dims)
 
         paste_coords = [dims[i] - image.size[i] for i in (0, 1)]  # align image with bottom of display
 
-        # write image to display
-        self._device.frame_buf.paste(image, paste_coords)
+        result = Image.new('L', dims, 0xFF)
+        result.paste(image, paste_coords)
+
+        return result
+
+    def _display(self, image):
+        self._device.frame_buf.paste(self.__frame(image))
         self._device.draw_full(self.it8951_constants.DisplayModes.GC16)
 
+    def _display_partial(self, image):
+        frame = self.__frame(image)
+
+        # the frame buffer still has the last frame drawn
+        box = ImageChops.difference(frame, self._device.frame_buf).getbbox()
+        if (box is None):
+            return
+
+        # the fast waveforms can only draw black and white
+        histogram = frame.crop(box).histogram()
+        waveform = self.it8951_constants.DisplayModes.GC16 if any(histogram[1:255]) else self._fast_waveform
+
+        # the driver only sends the area that changed
+        self._device.frame_buf.paste(frame)
+        self._device.draw_partial(waveform)
+
     def sleep(self):
         self._device.epd.sleep()
 
     def clear(self):
+        self._reset_refresh()
         self._device.clear()
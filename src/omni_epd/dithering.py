@@ -0,0 +1,543 @@
+"""
+Copyright 2026 Rob Weber
+
+This file is part of omni-epd
+
+omni-epd is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import json
+import os.path
+import numpy as np
+from PIL import Image
+
+# error diffusion matrices, these are the same ones used by didder
+# the current pixel is the one before the first non-zero value in the first row
+DIFFUSION_MATRICES = {
+    "simple2d": [[0, 0.5], [0.5, 0]],
+    "floydsteinberg": [[0, 0, 7 / 16], [3 / 16, 5 / 16, 1 / 16]],
+    "falsefloydsteinberg": [[0, 3 / 8], [3 / 8, 2 / 8]],
+    "jarvisjudiceninke": [[0, 0, 0, 7 / 48, 5 / 48], [3 / 48, 5 / 48, 7 / 48, 5 / 48, 3 / 48], [1 / 48, 3 / 48, 5 / 48, 3 / 48, 1 / 48]],
+    "atkinson": [[0, 0, 1 / 8, 1 / 8], [1 / 8, 1 / 8, 1 / 8, 0], [0, 1 / 8, 0, 0]],
+    "stucki": [[0, 0, 0, 8 / 42, 4 / 42], [2 / 42, 4 / 42, 8 / 42, 4 / 42, 2 / 42], [1 / 42, 2 / 42, 4 / 42, 2 / 42, 1 / 42]],
+    "burkes": [[0, 0, 0, 8 / 32, 4 / 32], [2 / 32, 4 / 32, 8 / 32, 4 / 32, 2 / 32]],
+    "sierra": [[0, 0, 0, 5 / 32, 3 / 32], [2 / 32, 4 / 32, 5 / 32, 4 / 32, 2 / 32], [0, 2 / 32, 3 / 32, 2 / 32, 0]],
+    "tworowsierra": [[0, 0, 0, 4 / 16, 3 / 16], [1 / 16, 2 / 16, 3 / 16, 2 / 16, 1 / 16]],
+    "sierralite": [[0, 0, 2 / 4], [1 / 4, 1 / 4, 0]],
+    "stevenpigeon": [[0, 0, 0, 2 / 14, 1 / 14], [0, 2 / 14, 2 / 14, 2 / 14, 0], [1 / 14, 0, 1 / 14, 0, 1 / 14]]
+}
+
+# other names didder accepts for the same matrices
+DIFFUSION_MATRICES["sierra3"] = DIFFUSION_MATRICES["sierra"]
+DIFFUSION_MATRICES["sierra2"] = DIFFUSION_MATRICES["tworowsierra"]
+DIFFUSION_MATRICES["sierra2_4a"] = DIFFUSION_MATRICES["sierralite"]
+
+# ordered dither matrices and their max value, these are the same ones used by didder
+ORDERED_MATRICES = {
+    "clustereddot4x4": ([[12, 5, 6, 13],
+                         [4, 0, 1, 7],
+                         [11, 3, 2, 8],
+                         [15, 10, 9, 14]], 16),
+    "vertical5x3": ([[9, 3, 0, 6, 12],
+                     [10, 4, 1, 7, 13],
+                     [11, 5, 2, 8, 14]], 15),
+    "horizontal3x5": ([[9, 10, 11],
+                       [3, 4, 5],
+                       [0, 1, 2],
+                       [6, 7, 8],
+                       [12, 13, 14]], 15),
+    "clustereddotdiagonal6x6": ([[8, 6, 7, 9, 11, 10],
+                                 [5, 0, 1, 12, 17, 16],
+                                 [4, 3, 2, 13, 14, 15],
+                                 [9, 11, 10, 8, 6, 8],
+                                 [12, 17, 16, 5, 0, 1],
+                                 [13, 14, 15, 4, 3, 2]], 18),
+    "clustereddot6x6": ([[34, 29, 17, 21, 30, 35],
+                         [28, 14, 9, 16, 20, 31],
+                         [13, 8, 4, 5, 15, 19],
+                         [12, 3, 0, 1, 10, 18],
+                         [27, 7, 2, 6, 23, 24],
+                         [33, 26, 11, 22, 25, 32]], 36),
+    "clustereddotspiral5x5": ([[20, 21, 22, 23, 24],
+                               [19, 6, 7, 8, 9],
+                               [18, 5, 0, 1, 10],
+                               [17, 4, 3, 2, 11],
+                               [16, 15, 14, 13, 12]], 25),
+    "clustereddothorizontalline": ([[35, 33, 31, 30, 32, 34],
+                                    [23, 21, 19, 18, 20, 22],
+                                    [11, 9, 7, 6, 8, 10],
+                                    [5, 3, 1, 0, 2, 4],
+                                    [17, 15, 13, 12, 14, 16],
+                                    [29, 27, 25, 24, 26, 28]], 36),
+    "clustereddotverticalline": ([[35, 23, 11, 5, 17, 29],
+                                  [33, 21, 9, 3, 15, 27],
+                                  [31, 19, 7, 1, 13, 25],
+                                  [30, 18, 6, 0, 12, 24],
+                                  [32, 20, 8, 2, 14, 26],
+                                  [34, 22, 10, 4, 16, 28]], 36),
+    "clustereddot6x6_2": ([[34, 25, 21, 17, 29, 33],
+                           [30, 13, 9, 5, 12, 24],
+                           [18, 6, 1, 0, 8, 20],
+                           [22, 10, 2, 3, 4, 16],
+                           [26, 14, 7, 11, 15, 28],
+                           [35, 31, 19, 23, 27, 32]], 36),
+    "clustereddot6x6_3": ([[30, 22, 16, 21, 33, 35],
+                           [24, 11, 7, 9, 26, 28],
+                           [13, 5, 0, 2, 14, 19],
+                           [15, 3, 1, 4, 12, 18],
+                           [27, 8, 6, 10, 25, 29],
+                           [32, 20, 17, 23, 31, 34]], 36),
+    "clustereddot8x8": ([[3, 9, 17, 27, 25, 15, 7, 1],
+                         [11, 29, 38, 46, 44, 36, 23, 5],
+                         [19, 40, 52, 58, 56, 50, 34, 13],
+                         [31, 48, 60, 63, 62, 54, 42, 21],
+                         [30, 47, 59, 63, 61, 53, 41, 20],
+                         [18, 39, 51, 57, 55, 49, 33, 12],
+                         [10, 28, 37, 45, 43, 35, 22, 4],
+                         [2, 8, 16, 26, 24, 14, 6, 0]], 64),
+    "clustereddotdiagonal8x8_2": ([[13, 9, 5, 12, 18, 22, 26, 19],
+                                   [6, 1, 0, 8, 25, 30, 31, 23],
+                                   [10, 2, 3, 4, 21, 29, 28, 27],
+                                   [14, 7, 11, 15, 17, 24, 20, 16],
+                                   [18, 22, 26, 19, 13, 9, 5, 12],
+                                   [25, 30, 31, 23, 6, 1, 0, 8],
+                                   [21, 29, 28, 27, 10, 2, 3, 4],
+                                   [17, 24, 20, 16, 14, 7, 11, 15]], 32),
+    "clustereddotdiagonal8x8": ([[24, 10, 12, 26, 35, 47, 49, 37],
+                                 [8, 0, 2, 14, 45, 59, 61, 51],
+                                 [22, 6, 4, 16, 43, 57, 63, 53],
+                                 [30, 20, 18, 28, 33, 41, 55, 39],
+                                 [34, 46, 48, 36, 25, 11, 13, 27],
+                                 [44, 58, 60, 50, 9, 1, 3, 15],
+                                 [42, 56, 62, 52, 23, 7, 5, 17],
+                                 [32, 40, 54, 38, 31, 21, 19, 29]], 64),
+    "clustereddotdiagonal8x8_3": ([[13, 11, 12, 15, 18, 20, 19, 16],
+                                   [4, 3, 2, 9, 27, 28, 29, 22],
+                                   [5, 0, 1, 10, 26, 31, 30, 21],
+                                   [8, 6, 7, 14, 23, 25, 24, 17],
+                                   [18, 20, 19, 16, 13, 11, 12, 15],
+                                   [27, 28, 29, 22, 4, 3, 2, 9],
+                                   [26, 31, 30, 21, 5, 0, 1, 10],
+                                   [23, 25, 24, 17, 8, 6, 7, 14]], 32),
+    "clustereddotdiagonal16x16": ([[63, 58, 50, 40, 41, 51, 59, 60, 64, 69, 77, 87, 86, 76, 68, 67],
+                                   [57, 33, 27, 18, 19, 28, 34, 52, 70, 94, 100, 109, 108, 99, 93, 75],
+                                   [49, 26, 13, 11, 12, 15, 29, 44, 78, 101, 114, 116, 115, 112, 98, 83],
+                                   [39, 17, 4, 3, 2, 9, 20, 42, 87, 110, 123, 124, 125, 118, 107, 85],
+                                   [38, 16, 5, 0, 1, 10, 21, 43, 89, 111, 122, 127, 126, 117, 106, 84],
+                                   [48, 25, 8, 6, 7, 14, 30, 45, 79, 102, 119, 121, 120, 113, 97, 82],
+                                   [56, 32, 24, 23, 22, 31, 35, 53, 71, 95, 103, 104, 105, 96, 92, 74],
+                                   [62, 55, 47, 37, 36, 46, 54, 61, 65, 72, 80, 90, 91, 81, 73, 66],
+                                   [64, 69, 77, 87, 86, 76, 68, 67, 63, 58, 50, 40, 41, 51, 59, 60],
+                                   [70, 94, 100, 109, 108, 99, 93, 75, 57, 33, 27, 18, 19, 28, 34, 52],
+                                   [78, 101, 114, 116, 115, 112, 98, 83, 49, 26, 13, 11, 12, 15, 29, 44],
+                                   [87, 110, 123, 124, 125, 118, 107, 85, 39, 17, 4, 3, 2, 9, 20, 42],
+                                   [89, 111, 122, 127, 126, 117, 106, 84, 38, 16, 5, 0, 1, 10, 21, 43],
+                                   [79, 102, 119, 121, 120, 113, 97, 82, 48, 25, 8, 6, 7, 14, 30, 45],
+                                   [71, 95, 103, 104, 105, 96, 92, 74, 56, 32, 24, 23, 22, 31, 35, 53],
+                                   [65, 72, 80, 90, 91, 81, 73, 66, 62, 55, 47, 37, 36, 46, 54, 61]], 128)
+}
+
+# lookup table to convert sRGB values to linear RGB, didder does all color math in linear RGB
+_srgb = np.arange(256, dtype=np.float32) / 255
+LINEAR_RGB = np.where(_srgb <= 0.04045, _srgb / 12.92, ((_srgb + 0.055) / 1.055) ** 2.4).astype(np.float32)
+
+# diffused error is kept as integers in units of 1 / ERROR_SCALE
+ERROR_SCALE = 1 << 20
+
+
+def load_json_arg(value):
+    """ load a dither_args JSON value, given either as a JSON string or path to a JSON file
+    :param value: the JSON string or file path
+
+    :raises ValueError: if the value isn't valid JSON or the file can't be read
+    :returns: the parsed JSON object
+    """
+    if (os.path.isfile(value)):
+        with open(value) as f:
+            value = f.read()
+
+    return json.loads(value)
+
+
+def bayer_matrix(width, height):
+    """ create a Bayer matrix, built up by repeatedly splitting each cell in to a 2x2 block
+    or a 2x1 block once one side is big enough, square matrices are the normal Bayer matrices
+    :param width: the width of the matrix, must be a power of two
+    :param height: the height of the matrix, must be a power of two
+
+    :raises ValueError: if the width or height isn't a power of two
+    :returns: the matrix as a list of rows
+    """
+    if (width < 1 or height < 1 or width & (width - 1) or height & (height - 1)):
+        raise ValueError(f"Bayer matrix dimensions must be powers of two: {width}x{height}")
+
+    result = np.zeros((1, 1), dtype=np.intp)
+    while (result.shape != (height, width)):
+        wide = result.shape[1] < width
+        tall = result.shape[0] < height
+
+        if (wide and tall):
+            result = np.block([[4 * result, 4 * result + 2], [4 * result + 3, 4 * result + 1]])
+        elif (wide):
+            result = np.hstack([2 * result, 2 * result + 1])
+        else:
+            result = np.vstack([2 * result, 2 * result + 1])
+
+    return result.tolist()
+
+
+def parse_bayer_arg(value):
+    """ parse the dither_args value for bayer dithering
+    :param value: the size of the matrix as X,Y
+
+    :raises ValueError: if the value isn't two numbers
+    :returns: tuple of (width, height)
+    """
+    size = [int(v) for v in value.lower().replace("x", ",").split(",")]
+
+    if (len(size) != 2):
+        raise ValueError(f"Bayer size must be given as X,Y: {value}")
+
+    return tuple(size)
+
+
+def load_ditherer(dither, palette, strength=1.0, serpentine=False, args=None):
+    """ create the builtin Ditherer for a dither algorithm, using the same options as didder
+    :param dither: the dither algorithm name
+    :param palette: the Palette to dither to
+    :param strength: the dither strength
+    :param serpentine: if serpentine scanning should be used for error diffusion
+    :param args: the dither_args value, if any
+
+    :raises ValueError: if the args aren't valid for the algorithm
+    :returns: a Ditherer, or None if the algorithm isn't supported
+    """
+    if (dither in DIFFUSION_MATRICES):
+        return ErrorDiffusionDitherer(palette, DIFFUSION_MATRICES[dither], strength, serpentine)
+    elif (dither == "customdiffusion"):
+        return ErrorDiffusionDitherer(palette, load_json_arg(args or ''), strength, serpentine)
+    elif (dither in ORDERED_MATRICES):
+        return OrderedDitherer(palette, *ORDERED_MATRICES[dither], strength)
+    elif (dither == "customordered"):
+        custom = load_json_arg(args or '')
+        if (not isinstance(custom, dict)):
+            raise ValueError("Ordered dither matrix must be an object with matrix and max values")
+
+        return OrderedDitherer(palette, custom.get("matrix"), custom.get("max"), strength)
+    elif (dither == "bayer"):
+        width, height = parse_bayer_arg(args or '4,4')
+
+        # only powers of two are built here, didder also has 3x3, 3x5 and 5x3 matrices so those are left to it
+        if (width & (width - 1) or height & (height - 1)):
+            return None
+
+        return OrderedDitherer(palette, bayer_matrix(width, height), width * height, strength)
+    elif (dither == "random"):
+        return RandomDitherer(palette, [float(v) for v in (args or '-0.5,0.5').split(",")])
+
+    return None
+
+
+class Ditherer:
+    """
+    Base class for the dithering algorithms that run in process instead of calling didder.
+    Images are converted to linear RGB and each pixel is mapped to the nearest palette color.
+    L images are kept as a single channel when all the palette colors are greys
+    """
+
+    def __init__(self, palette):
+        """
+        :param palette: the Palette to dither to
+        """
+        self.palette = palette
+
+        colors = np.array(palette.colors, dtype=np.uint8)
+        self._colors = colors
+        self._linear = LINEAR_RGB[colors]
+
+        # used to find the nearest color, |v - p|^2 = |v|^2 - 2v.p + |p|^2 and |v|^2 is the same for all colors
+        self._weights = -2 * self._linear.T
+        self._bias = (self._linear ** 2).sum(axis=1)
+
+        # the same for single channel values, the channels of grey colors are all the same
+        self.grey_palette = palette.grayscale
+        self._grey_bias = self._linear[:, 0] ** 2
+
+    def nearest(self, values):
+        """ find the nearest palette color for each value
+        :param values: array of linear RGB values, shape (n, 3), or grey values, shape (n, 1), for grey palettes
+
+        :returns: array of palette indexes
+        """
+        if (values.shape[1] == 1):
+            return np.argmin(values @ self._weights[:1] + self._grey_bias, axis=1)
+
+        return np.argmin(values @ self._weights + self._bias, axis=1)
+
+    def _to_linear(self, image):
+        """ convert the image to an array of linear values, shape (height, width, channels). L images for
+        grey palettes have one channel, all other images are converted to RGB """
+        if (image.mode == "L" and self.grey_palette):
+            return LINEAR_RGB[np.asarray(image)][:, :, np.newaxis]
+
+        return LINEAR_RGB[np.asarray(image.convert("RGB") if image.mode != "RGB" else image)]
+
+    def _to_image(self, indexes, channels=3):
+        """ convert an array of palette indexes to an image of the palette colors, L for single channel values and RGB otherwise """
+        if (channels == 1):
+            return Image.fromarray(self._colors[indexes, 0], "L")
+
+        return Image.fromarray(self._colors[indexes], "RGB")
+
+    def dither(self, image):
+        """ REQUIRED - dither the image to the palette
+        :param image: an Image object
+
+        :returns: an RGB image containing only palette colors, or an L image for L images and grey palettes
+        """
+        raise NotImplementedError
+
+    def dither_band(self, image, top, carry):
+        """ OPTIONAL - dither a band of rows from a larger image, used when images are processed in bands.
+        By default each band is dithered on its own, this is right when pixels don't depend on each other
+        :param image: an Image object with the rows of the band
+        :param top: the row of the larger image the band starts at
+        :param carry: the carry returned for the band above, None for the first band
+
+        :returns: tuple of the dithered image, like dither(), and the carry for the next band
+        """
+        return self.dither(image), None
+
+
+class ErrorDiffusionDitherer(Ditherer):
+    """
+    Error diffusion dithering using the same matrices and options as didder.
+
+    Error diffusion is sequential, each pixel depends on the pixels before it. Pixels along a skewed diagonal
+    don't depend on each other though so these are done at once, this takes width + k * height array operations
+    where k is based on how far the matrix reaches back to the left. Serpentine scanning can't be done this way,
+    it is done one pixel at a time which is a lot slower.
+    """
+
+    def __init__(self, palette, matrix, strength=1.0, serpentine=False):
+        """
+        :param palette: the Palette to dither to
+        :param matrix: the error diffusion matrix as a list of rows
+        :param strength: multiplied with the matrix to change the amount of error spread
+        :param serpentine: if every other row should be done right to left
+
+        :raises ValueError: if the matrix is not valid
+        """
+        super().__init__(palette)
+
+        if (not matrix or not all(isinstance(r, list) and r for r in matrix)):
+            raise ValueError("Error diffusion matrix must be a list of rows")
+
+        # current pixel is the one before the first non-zero value in the first row, or the middle if all are zero
+        current = next((i - 1 for i, v in enumerate(matrix[0]) if v != 0), len(matrix[0]) // 2)
+        if (current < 0):
+            raise ValueError("Error diffusion matrix has no current pixel")
+
+        # (row offset, column offset, weight) for every cell that gets some of the error
+        self.offsets = [(dy, dx - current, float(w) * strength) for dy, row in enumerate(matrix)
+                        for dx, w in enumerate(row) if w != 0 and (dy > 0 or dx > current)]
+        self.serpentine = serpentine
+
+    def dither(self, image):
+        return self.dither_band(image, 0, None)[0]
+
+    def dither_band(self, image, top, carry):
+        # the carry is the error spread past the bottom of the band, it is added to the next band
+        values = self._to_linear(image)
+
+        if (self.serpentine):
+            indexes, carry = self._diffuse_serpentine(values, top, carry)
+        else:
+            indexes, carry = self._diffuse(values, carry)
+
+        return self._to_image(indexes, values.shape[2]), carry
+
+    def _diffuse(self, values, carry=None):
+        """ diffuse the error by processing skewed diagonals of pixels at once
+        :param values: array of linear values, shape (height, width, channels)
+        :param carry: error for the first rows from the band above, from the last call
+
+        :returns: tuple of the array of palette indexes, shape (height, width), and the error for the rows below
+        """
+        height, width, channels = values.shape
+
+        left = max([-dx for _, dx, _ in self.offsets] + [0])
+        right = max([dx for _, dx, _ in self.offsets] + [0])
+        down = max([dy for dy, _, _ in self.offsets] + [0])
+
+        # pixels where x + k * y is the same don't depend on each other
+        k = max([-dx // dy + 1 for dy, dx, _ in self.offsets if dy > 0 and dx < 0] + [1])
+
+        # pad the buffers so errors can be written past the edges without checking bounds
+        stride = width + left + right
+        padded = np.zeros((height, stride, channels), dtype=np.float32)
+        padded[:, left:left + width] = values
+        padded = padded.reshape(-1, channels)
+
+        # errors are kept apart from the values as fixed point integers, these add up to the same value in any order
+        # so the result is the same when the image is done in bands
+        buf = np.zeros((height + down, stride, channels), dtype=np.int32)
+        if (carry is not None):
+            buf[:down] = carry
+
+        below = buf[height:]
+        buf = buf.reshape(-1, channels)
+
+        # offsets for each weight, so the error is scaled and rounded once for each weight
+        offsets = {}
+        for dy, dx, w in self.offsets:
+            offsets.setdefault(w * ERROR_SCALE, []).append(dy * stride + dx)
+
+        linear = self._linear[:, :channels]
+        result = np.zeros(height * width, dtype=np.uint8)
+
+        for t in range(width + k * (height - 1)):
+            ys = np.arange(max(0, -(-(t - width + 1) // k)), min(height - 1, t // k) + 1)
+            xs = t - k * ys
+
+            pos = ys * stride + xs + left
+            pixels = np.clip(padded[pos] + buf[pos] * np.float32(1 / ERROR_SCALE), 0, 1)
+
+            nearest = self.nearest(pixels)
+            result[ys * width + xs] = nearest
+
+            error = pixels - linear[nearest]
+            for weight, targets in offsets.items():
+                scaled = np.rint(error * weight).astype(np.int32)
+                for offset in targets:
+                    buf[pos + offset] += scaled
+
+        return result.reshape(height, width), below
+
+    def _diffuse_serpentine(self, values, top=0, carry=None):
+        """ diffuse the error one pixel at a time, alternating the direction of each row
+        :param values: array of linear values, shape (height, width, channels)
+        :param top: row of the full image the values start at, this sets the direction of each row
+        :param carry: error for the first rows from the band above, from the last call
+
+        :returns: tuple of the array of palette indexes, shape (height, width), and the error for the rows below
+        """
+        height, width, channels = values.shape
+        down = max([dy for dy, _, _ in self.offsets] + [0])
+
+        values = values.reshape(height, width * channels).tolist()
+        linear = self._linear[:, :channels].tolist()
+        result = np.zeros((height, width), dtype=np.uint8)
+
+        # errors for each row, kept apart from the values like _diffuse()
+        rows = [[0.0] * (width * channels) for _ in range(height + down)]
+        if (carry is not None):
+            rows[:down] = carry
+
+        for y in range(height):
+            reverse = (top + y) % 2 == 1
+            offsets = [(rows[y + dy], -dx if reverse else dx, w) for dy, dx, w in self.offsets]
+            row = rows[y]
+            value = values[y]
+
+            for x in (range(width - 1, -1, -1) if reverse else range(width)):
+                pixel = [min(max(v + e, 0.0), 1.0) for v, e in zip(value[x * channels:(x + 1) * channels], row[x * channels:(x + 1) * channels])]
+
+                nearest = min(range(len(linear)), key=lambda i: sum((a - b) ** 2 for a, b in zip(pixel, linear[i])))
+                result[y, x] = nearest
+
+                error = [a - b for a, b in zip(pixel, linear[nearest])]
+                for target, dx, w in offsets:
+                    tx = x + dx
+                    if (0 <= tx < width):
+                        for c in range(channels):
+                            target[tx * channels + c] += error[c] * w
+
+        return result, rows[height:]
+
+
+class OrderedDitherer(Ditherer):
+    """
+    Ordered dithering with a threshold matrix, the matrix is tiled over the image and each threshold
+    is added to the pixel before mapping it to the nearest palette color. No pixel depends on any other
+    so the whole image is done in one array operation.
+    """
+
+    def __init__(self, palette, matrix, max_value, strength=1.0):
+        """
+        :param palette: the Palette to dither to
+        :param matrix: the threshold matrix as a list of rows, values from 0 to max_value - 1
+        :param max_value: the max value of the matrix
+        :param strength: multiplied with the thresholds to change the amount of dithering
+
+        :raises ValueError: if the matrix is not valid
+        """
+        super().__init__(palette)
+
+        if (not matrix or not isinstance(matrix, list) or not all(isinstance(r, list) and len(r) == len(matrix[0]) for r in matrix)):
+            raise ValueError("Ordered dither matrix must be a list of rows with the same length")
+
+        if (not isinstance(max_value, (int, float)) or max_value <= 0):
+            raise ValueError(f"Ordered dither max must be a positive number: {max_value}")
+
+        # convert the thresholds to values added to the pixels, spread evenly around 0
+        self.thresholds = (strength * ((np.array(matrix, dtype=np.float32) + 1) / max_value - 0.5)).astype(np.float32)
+
+    def dither(self, image):
+        return self.dither_band(image, 0, None)[0]
+
+    def dither_band(self, image, top, carry):
+        values = self._to_linear(image)
+        height, width, channels = values.shape
+        rows, columns = self.thresholds.shape
+
+        # the matrix lines up with the top of the full image
+        thresholds = np.roll(self.thresholds, -(top % rows), axis=0)
+        thresholds = np.tile(thresholds, (-(-height // rows), -(-width // columns)))[:height, :width]
+        values = np.clip(values + thresholds[:, :, np.newaxis], 0, 1)
+
+        return self._to_image(self.nearest(values.reshape(-1, channels)).reshape(height, width), channels), None
+
+
+class RandomDitherer(Ditherer):
+    """ adds random noise to each pixel before mapping it to the nearest palette color """
+
+    def __init__(self, palette, ranges):
+        """
+        :param palette: the Palette to dither to
+        :param ranges: min,max of the noise for all channels, or min,max for each of the R, G and B channels
+
+        :raises ValueError: if the ranges are not valid
+        """
+        super().__init__(palette)
+
+        if (len(ranges) not in (2, 6)):
+            raise ValueError("Random dither arguments must be min,max or min_r,max_r,min_g,max_g,min_b,max_b")
+
+        self.grayscale = len(ranges) == 2
+        self.ranges = np.array(ranges, dtype=np.float32).reshape(-1, 2)
+
+        # different noise for each channel needs RGB values
+        self.grey_palette = self.grey_palette and self.grayscale
+
+    def dither(self, image):
+        values = self._to_linear(image)
+        height, width, channels = values.shape
+
+        minimum, maximum = self.ranges[:, 0], self.ranges[:, 1]
+        noise = np.random.random((height, width, 1 if self.grayscale else channels)).astype(np.float32)
+        values = np.clip(values + minimum + noise * (maximum - minimum), 0, 1)
+
+        return self._to_image(self.nearest(values.reshape(-1, channels)).reshape(height, width), channels)
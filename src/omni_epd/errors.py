@@ -36,3 +36,16 @@ class EPDConfigurationError(Exception):
 
     def __init__(self, deviceName, optionName, optionValue):
         super().__init__(f"'{optionValue}' for '{optionName}' is not a valid configuration value for {deviceName}")
+
+
+class EPDUpdateError(Exception):
+    """
+    EPDUpdateError is thrown by DisplayManager when one or more displays fail, the other displays
+    are still updated. errors has the exception for each display that failed and results has the
+    return value for each display that worked
+    """
+
+    def __init__(self, errors, results):
+        self.errors = errors
+        self.results = results
+        super().__init__(f"{len(errors)} display(s) failed to update: {', '.join(f'{n} ({e})' for n, e in errors.items())}")
@@ -0,0 +1,186 @@
+"""
+Copyright 2026 Rob Weber
+
+This file is part of omni-epd
+
+omni-epd is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import collections
+import hashlib
+import logging
+import os
+import threading
+from PIL import Image
+
+
+def image_size(image):
+    """ estimate how much memory an image uses
+    :param image: an Image object
+
+    :returns: the size in bytes
+    """
+    return image.width * image.height * len(image.getbands())
+
+
+class FrameCache:
+    """
+    Least recently used cache of processed images, keyed by a digest of the source image and the settings
+    used to process it. Attach to displays with VirtualEPD.set_frame_cache(), one cache can be shared by
+    several displays so displays with the same settings reuse the same processed images.
+    Images are kept in memory and can also be saved to a directory so they're kept between runs.
+    Images returned from the cache are shared, they must not be modified.
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024, directory=None, max_disk_size=256 * 1024 * 1024):
+        """
+        :param max_size: bytes of image data to keep in memory
+        :param directory: directory to save processed images to, None to only keep them in memory
+        :param max_disk_size: bytes of files to keep in the directory
+        """
+        self.max_size = max_size
+        self.directory = directory
+        self.max_disk_size = max_disk_size
+
+        self.hits = 0
+        self.misses = 0
+
+        self._memory = collections.OrderedDict()  # key -> (image, size), least recently used first
+        self._memory_size = 0
+        self._disk = collections.OrderedDict()  # key -> file size, least recently used first
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+
+        if (directory is not None):
+            os.makedirs(directory, exist_ok=True)
+
+            # files from previous runs, oldest first
+            files = [e for e in os.scandir(directory) if e.name.endswith(".png")]
+            for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+                self._disk[entry.name[:-4]] = entry.stat().st_size
+                self._disk_size += entry.stat().st_size
+
+            self.__evict_disk()
+
+    @staticmethod
+    def make_key(image, settings):
+        """ create the cache key for an image
+        :param image: the source Image object
+        :param settings: a string with all the settings used to process the image
+
+        :returns: the key as a hex string
+        """
+        result = hashlib.blake2b(f"{settings} {image.mode} {image.size}".encode(), digest_size=20)
+        result.update(image.tobytes())
+
+        return result.hexdigest()
+
+    def __path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get(self, key):
+        """ get an image from the cache, counts as a hit or a miss
+        :param key: a key from make_key()
+
+        :returns: the processed Image object, or None if it isn't in the cache
+        """
+        with self._lock:
+            if (key in self._memory):
+                self._memory.move_to_end(key)
+                self.hits += 1
+
+                return self._memory[key][0]
+
+            if (key in self._disk):
+                try:
+                    with Image.open(self.__path(key)) as f:
+                        image = f.copy()
+                except OSError as e:
+                    self._logger.warning(f"Can't read cached image {key}: {e}")
+                    self._disk_size -= self._disk.pop(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self.__add_memory(key, image)
+                    self.hits += 1
+
+                    return image
+
+            self.misses += 1
+
+            return None
+
+    def put(self, key, image):
+        """ add a processed image to the cache, least recently used images are removed if it is full
+        :param key: a key from make_key()
+        :param image: the processed Image object
+        """
+        with self._lock:
+            self.__add_memory(key, image)
+
+            if (self.directory is not None and key not in self._disk):
+                try:
+                    image.save(self.__path(key), "PNG", compress_level=1)
+                except OSError as e:
+                    self._logger.warning(f"Can't save cached image {key}: {e}")
+                else:
+                    self._disk[key] = os.path.getsize(self.__path(key))
+                    self._disk_size += self._disk[key]
+                    self.__evict_disk()
+
+    def __add_memory(self, key, image):
+        size = image_size(image)
+
+        if (key in self._memory or size > self.max_size):
+            return
+
+        self._memory[key] = (image, size)
+        self._memory_size += size
+
+        while (self._memory_size > self.max_size):
+            self._memory_size -= self._memory.popitem(last=False)[1][1]
+
+    def __evict_disk(self):
+        while (self._disk_size > self.max_disk_size):
+            key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+
+            try:
+                os.remove(self.__path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """ remove all images from memory and the cache directory, and reset the hit and miss counters """
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+
+            for key in self._disk:
+                try:
+                    os.remove(self.__path(key))
+                except OSError:
+                    pass
+
+            self._disk.clear()
+            self._disk_size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """ returns a dict with the hit and miss counts, and the number and size of the images cached """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "images": len(self._memory), "size": self._memory_size,
+                    "disk_images": len(self._disk), "disk_size": self._disk_size}
@@ -0,0 +1,62 @@
+"""
+Copyright 2026 Rob Weber
+
+This file is part of omni-epd
+
+omni-epd is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import logging
+
+
+class DisplayObserver:
+    """
+    Receives an event before and after each step of updating a display, attach to a display with VirtualEPD.set_observer()
+    Steps are the pipeline stages (transform, tone, dither, etc) and the display methods
+    prepare, display, sleep, clear and close. Override the methods needed, by default they do nothing
+    """
+
+    def stage_started(self, device, stage):
+        """ called before a step is run
+        :param device: the device name, from VirtualEPD.getName()
+        :param stage: the name of the step
+        """
+        pass
+
+    def stage_finished(self, device, stage, duration):
+        """ called after a step is run, even if it raised an error
+        :param device: the device name, from VirtualEPD.getName()
+        :param stage: the name of the step
+        :param duration: how long the step took in seconds
+        """
+        pass
+
+
+class TimingObserver(DisplayObserver):
+    """
+    Keeps the duration of every step, grouped by device and step name, and logs each one at debug level
+    """
+
+    def __init__(self):
+        self.timings = {}  # (device, stage) -> list of durations
+        self._logger = logging.getLogger(__name__)
+
+    def stage_finished(self, device, stage, duration):
+        self.timings.setdefault((device, stage), []).append(duration)
+        self._logger.debug(f"{device} {stage} took {duration * 1000:.1f}ms")
+
+    def totals(self):
+        """ returns the total time spent in each step as a dict of (device, stage) -> seconds """
+        return {k: sum(v) for k, v in self.timings.items()}
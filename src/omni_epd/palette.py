@@ -0,0 +1,115 @@
+"""
+Copyright 2026 Rob Weber
+
+This file is part of omni-epd
+
+omni-epd is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import itertools
+import re
+from PIL import Image, ImageColor
+
+# matches a single color in a palette string, as a hex value, RGB list or color name
+COLOR_PATTERN = re.compile(fr'#[a-fA-F0-9]{{6}}|\[?\d{{1,3}},\d{{1,3}},\d{{1,3}}\]?|{"|".join(ImageColor.colormap.keys())}', re.IGNORECASE)
+HEX_PATTERN = re.compile(r'#[a-fA-F0-9]{6}')
+RGB_PATTERN = re.compile(r'\[?(\d{1,3}),(\d{1,3}),(\d{1,3})\]?')
+
+
+def parse_color(color_str):
+    """ parse the color infomration to return a RGB color from a color string
+    :param color_str: the color as either a hex value (#000000), RGB list [R,G,B] or color name (blue, red)
+    :raises ValueError: if the color string is in an invalid format
+
+    :returns: the color_str converted to a list of RGB values
+    """
+    if HEX_PATTERN.match(color_str) or color_str.lower() in ImageColor.colormap:
+        return list(ImageColor.getrgb(color_str))
+    elif RGB_PATTERN.match(color_str):
+        return list(map(int, re.findall(r'\d{1,3}', color_str)))
+    else:
+        raise ValueError(f"Invalid color format: {color_str}")
+
+
+def parse_palette(colors):
+    """ generate a palette given the colors available for this display
+    :param colors: a list of valid colors as a string
+
+    :returns: a list of RGB values
+    """
+    return list(map(parse_color, COLOR_PATTERN.findall(colors.replace(" ", ""))))
+
+
+class Palette:
+    """
+    The colors a display can show, along with the formats they're needed in by the image filtering and dithering functions.
+    This is created once when the display is loaded so the palette doesn't have to be parsed for every image.
+    """
+
+    def __init__(self, colors):
+        """
+        :param colors: a list of RGB values
+        """
+        self.colors = tuple(tuple(c) for c in colors)
+        self._color_set = frozenset(self.colors)
+
+        # palette image used by Image.quantize(), all other colors set to 0
+        self.image = Image.new("P", (1, 1))
+        self.image.putpalette(list(itertools.chain.from_iterable(self.colors)) + [0, 0, 0] * (256 - len(self.colors)))
+
+        # palette formatted the way didder expects it
+        self.didder_arg = " ".join([",".join(map(str, c)) for c in self.colors])
+
+        # if all the colors are greys, images for these palettes can be processed as L images
+        self.grayscale = all(r == g == b for r, g, b in self.colors)
+
+        # grey value -> palette index for grayscale palettes, values not in the palette are 0
+        self.index_table = None
+        if (self.grayscale):
+            self.index_table = [0] * 256
+            for i, (v, _, _) in reversed(list(enumerate(self.colors))):
+                self.index_table[v] = i
+
+    def matches(self, image):
+        """ check if every pixel of an RGB or L image is a palette color, like the images made by dithering.
+        The check stops as soon as more colors than the palette has are found so other images are rejected quickly
+        :param image: an Image object
+
+        :returns: True if the image only has palette colors
+        """
+        if (image.mode not in ("RGB", "L")):
+            return False
+
+        colors = image.getcolors(len(self.colors))
+        if (colors is not None and image.mode == "L"):
+            colors = [(n, (v, v, v)) for n, v in colors]
+
+        return colors is not None and all(c in self._color_set for _, c in colors)
+
+    def __len__(self):
+        return len(self.colors)
+
+    def __eq__(self, other):
+        return isinstance(other, Palette) and self.colors == other.colors
+
+    def __hash__(self):
+        return hash(self.colors)
+
+    def __str__(self):
+        return self.didder_arg
+
+
+# palette used for b+w displays
+BW_PALETTE = Palette([[255, 255, 255], [0, 0, 0]])
@@ -0,0 +1,391 @@
+"""
+Copyright 2026 Rob Weber
+
+This file is part of omni-epd
+
+omni-epd is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import math
+import struct
+from PIL import Image, ImageEnhance, ImageStat
+
+# flip options in the [Display] section and the transpose method to use for them
+FLIP_OPTIONS = (("flip_horizontal", Image.Transpose.FLIP_LEFT_RIGHT),
+                ("flip_vertical", Image.Transpose.FLIP_TOP_BOTTOM))
+
+# grey levels of 4 shade grayscale displays, from black to white
+GRAY4_LEVELS = (0, 128, 192, 255)
+
+
+def gray4_code(value):
+    """ the 2 bit code a Waveshare getbuffer_4Gray() method gives a grey value, 128 and 192 are the two grey levels
+    :param value: a grey value, 0 - 255
+
+    :returns: the code, 0 (black) to 3 (white)
+    """
+    return 2 if value == 192 else 1 if value == 128 else value >> 6
+
+
+def float32(value):
+    """ round a value to single precision, the way Pillow does its blend calculations """
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+def blend_value(degenerate, value, factor):
+    """ the result of Image.blend() for a single value, this is what the ImageEnhance classes use
+    :param degenerate: value from the degenerate image, 0 for brightness and the mean grey level for contrast
+    :param value: value from the image
+    :param factor: the enhancement factor
+
+    :returns: the blended value, 0 - 255
+    """
+    result = float32(degenerate + float32(float32(factor) * (value - degenerate)))
+
+    return 0 if result <= 0 else 255 if result >= 255 else int(result)
+
+
+class PipelineStage:
+    """
+    A single step of the image pipeline run by VirtualEPD.display()
+    Stages are created once by VirtualEPD.compile_pipeline() with their values already parsed and validated,
+    this way no configuration lookups are needed for each frame
+    """
+
+    name = "stage"  # short name of this stage
+    margin = None  # rows above and below a band this stage needs to see when run in bands, None if it can't be run in bands
+
+    def apply(self, image):
+        """ REQUIRED - apply this stage to the image
+        :param image: an Image object
+
+        :returns: the modified image
+        """
+        raise NotImplementedError
+
+    def start(self, image, band_height):
+        """ OPTIONAL - called with the full image before it is run in bands, for stages that need values from all of it
+        :param image: an Image object
+        :param band_height: rows in each band, larger parts of the image shouldn't be processed at once
+
+        :returns: the state passed to apply_band() with the first band
+        """
+        return None
+
+    def apply_band(self, image, top, state):
+        """ OPTIONAL - apply this stage to a band of rows, by default the band is passed to apply()
+        :param image: an Image object with the rows of the band, and the margin rows above and below it
+        :param top: the row of the full image the first row of image is from
+        :param state: the state from start() for the first band, or from apply_band() for the band above
+
+        :returns: tuple of the modified band and the state for the next band
+        """
+        return self.apply(image), state
+
+    def __str__(self):
+        return self.name
+
+
+class ConvertStage(PipelineStage):
+    """
+    Converts the image to the mode the rest of the pipeline works in. Displays that only show greys use L, so
+    each stage after this one handles a third of the data of an RGB image
+    """
+
+    name = "convert"
+    margin = 0
+
+    def __init__(self, mode):
+        self.mode = mode
+
+    def apply(self, image):
+        return image if image.mode == self.mode else image.convert(self.mode)
+
+    def __str__(self):
+        return f"{self.name} {self.mode}"
+
+
+class TransformStage(PipelineStage):
+    """
+    Rotates and flips the image as a single operation. Right angle rotations and flips are reduced to one
+    lossless Image.transpose() call, any other angle is done as one affine transform that includes the flips.
+    Rotating by 90 or 270 degrees swaps the width and height of the image.
+    """
+
+    name = "transform"
+
+    def __init__(self, angle=0, flip_horizontal=False, flip_vertical=False):
+        self.angle = angle % 360
+        self.flip_horizontal = flip_horizontal
+        self.flip_vertical = flip_vertical
+
+        # the transpose method to use, None for arbitrary angles
+        self.method = None
+        self.identity = False
+
+        if (self.angle % 90 == 0):
+            self.method = self.__find_transpose()
+            self.identity = self.method is None
+
+    def __find_transpose(self):
+        """ find the one transpose method equal to the rotate and flip operations
+        by applying them to a small test image and comparing with each method
+
+        :returns: the Image.Transpose method, or None if the image is unchanged
+        """
+        test = Image.frombytes("L", (3, 2), bytes(range(6)))
+
+        result = test.rotate(self.angle, expand=True)
+        for option, method in FLIP_OPTIONS:
+            if (getattr(self, option)):
+                result = result.transpose(method)
+
+        if (result.tobytes() == test.tobytes()):
+            return None
+
+        return next(m for m in Image.Transpose if test.transpose(m).size == result.size and test.transpose(m).tobytes() == result.tobytes())
+
+    @property
+    def swaps_axes(self):
+        """ True if the width and height of the image are swapped by this transform """
+        return self.method in (Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_270, Image.Transpose.TRANSPOSE, Image.Transpose.TRANSVERSE)
+
+    def affine_matrix(self, size):
+        """ get the affine matrix for the rotation and flips, same as Image.rotate() without expanding the image
+        :param size: the (width, height) of the image
+
+        :returns: the 6 values of the inverse affine matrix used by Image.transform()
+        """
+        w, h = size
+        angle = -math.radians(self.angle)
+
+        a, b = round(math.cos(angle), 15), round(math.sin(angle), 15)
+        d, e = -b, a
+
+        # rotate around the center
+        c = -a * w / 2.0 - b * h / 2.0 + w / 2.0
+        f = -d * w / 2.0 - e * h / 2.0 + h / 2.0
+
+        # flipping the output is the same as mirroring the input coordinates
+        if (self.flip_horizontal):
+            a, c, d, f = -a, a * w + c, -d, d * w + f
+
+        if (self.flip_vertical):
+            b, c, e, f = -b, b * h + c, -e, e * h + f
+
+        return (a, b, c, d, e, f)
+
+    def apply(self, image):
+        if (self.method is not None):
+            return image.transpose(self.method)
+        elif (self.identity):
+            return image
+        else:
+            return image.transform(image.size, Image.Transform.AFFINE, self.affine_matrix(image.size), Image.Resampling.NEAREST)
+
+    def __str__(self):
+        result = [f"rotate {self.angle}"] + [o for o, _ in FLIP_OPTIONS if getattr(self, o)]
+
+        return f"{self.name} {' '.join(result)} ({self.method.name if self.method is not None else 'affine'})"
+
+
+class EnhanceStage(PipelineStage):
+    """ applies one of the PIL.ImageEnhance classes (contrast, brightness, etc) with the given factor """
+
+    def __init__(self, name, enhancer, factor):
+        self.name = name
+        self.enhancer = enhancer
+        self.factor = factor
+
+        # sharpness uses a 3x3 filter, other enhancers work on the whole image
+        self.margin = 1 if enhancer is ImageEnhance.Sharpness else None
+
+    def apply(self, image):
+        return self.enhancer(image).enhance(self.factor)
+
+    def __str__(self):
+        return f"{self.name} {self.factor}"
+
+
+class ToneStage(PipelineStage):
+    """
+    Applies contrast, brightness and gamma as a single Image.point() lookup table instead of a blend for each one.
+    Contrast and brightness give the same values as ImageEnhance.Contrast and ImageEnhance.Brightness.
+    Contrast depends on the mean grey level of the image, so a table is made and cached for each mean
+    """
+
+    name = "tone"
+    margin = 0
+
+    # modes the table can be applied to, other modes are converted to RGB
+    MODES = ("L", "RGB", "RGBA")
+
+    def __init__(self, contrast=None, brightness=None, gamma=None):
+        """
+        :param contrast: contrast factor, None for no adjustment
+        :param brightness: brightness factor, None for no adjustment
+        :param gamma: gamma correction, values over 1 lighten the mid tones, None for no adjustment
+        """
+        self.contrast = contrast
+        self.brightness = brightness
+        self.gamma = gamma
+        self._tables = {}  # mean grey level -> table
+
+    def table(self, mean=0):
+        """ the lookup table for one band
+        :param mean: the mean grey level of the image, only used for contrast
+
+        :returns: a list of 256 values
+        """
+        if (mean not in self._tables):
+            result = list(range(256))
+
+            if (self.contrast is not None):
+                result = [blend_value(mean, v, self.contrast) for v in result]
+
+            if (self.brightness is not None):
+                result = [blend_value(0, v, self.brightness) for v in result]
+
+            if (self.gamma is not None):
+                result = [round(255 * (v / 255) ** (1 / self.gamma)) for v in result]
+
+            self._tables[mean] = result
+
+        return self._tables[mean]
+
+    def apply(self, image):
+        return self.apply_band(image, 0, self.start(image, image.height))[0]
+
+    def start(self, image, band_height):
+        if (self.contrast is None):
+            return 0
+
+        # same as ImageEnhance.Contrast, the histogram is added up a band at a time
+        histogram = [0] * 256
+        for top in range(0, image.height, band_height):
+            band = image.crop((0, top, image.width, min(top + band_height, image.height)))
+            if (band.mode != "L"):
+                band = (band if band.mode in self.MODES else band.convert("RGB")).convert("L")
+
+            histogram = [a + b for a, b in zip(histogram, band.histogram())]
+
+        return int(ImageStat.Stat(histogram).mean[0] + 0.5)
+
+    def apply_band(self, image, top, mean):
+        if (image.mode not in self.MODES):
+            image = image.convert("RGB")
+
+        table = self.table(mean)
+
+        # alpha isn't changed
+        return image.point(table * 3 + list(range(256)) if image.mode == "RGBA" else table * len(image.getbands())), mean
+
+    def __str__(self):
+        result = [f"{o} {getattr(self, o)}" for o in TONE_OPTIONS if getattr(self, o) is not None]
+
+        return f"{self.name} {' '.join(result)}"
+
+
+class DitherStage(PipelineStage):
+    """ applies a dithering algorithm using the given dither function, normally VirtualEPD._ditherImage """
+
+    name = "dither"
+
+    def __init__(self, dither, ditherer, engine=None):
+        """
+        :param dither: the dither algorithm name
+        :param ditherer: function(image, dither) that dithers an image
+        :param engine: the dithering.Ditherer used by the function, needed to run this stage in bands
+        """
+        self.dither = dither
+        self.ditherer = ditherer
+        self.engine = engine
+        self.margin = None if engine is None else 0
+
+    def apply(self, image):
+        return self.ditherer(image, self.dither)
+
+    def apply_band(self, image, top, carry):
+        return self.engine.dither_band(image, top, carry)
+
+    def __str__(self):
+        return f"{self.name} {self.dither}"
+
+
+class Gray4Stage(PipelineStage):
+    """
+    Converts the image to the 4 grey levels of a 4 shade grayscale display with a lookup table. Values are mapped
+    to the same level the display driver would pick, dithered images that already use the levels aren't changed
+    """
+
+    name = "gray4"
+    margin = 0
+
+    # grey value -> display level
+    table = [GRAY4_LEVELS[gray4_code(v)] for v in range(256)]
+
+    def apply(self, image):
+        return (image if image.mode == 'L' else image.convert('L')).point(self.table)
+
+
+# options in the [Image Enhancements] section done by the ToneStage, in the order they are applied
+TONE_OPTIONS = ("contrast", "brightness", "gamma")
+
+# options in the [Image Enhancements] section applied after the ToneStage and the enhancer class for them
+ENHANCEMENT_OPTIONS = (("sharpness", ImageEnhance.Sharpness), )
+
+
+def run_bands(stages, image, band_height, call=None):
+    """ run pipeline stages on an image in bands of rows, each band goes through all the stages and is then
+    pasted into the result. Only the image, the result and the current band are kept in memory
+    :param stages: PipelineStage objects, all of them must have a margin
+    :param image: an Image object
+    :param band_height: rows in each band
+    :param call: function(name, method, *args) used to run each stage, the method is run directly if None
+
+    :returns: the processed image
+    """
+    width, height = image.size
+
+    # rows of context needed before each stage, so every stage after it has the margin it needs
+    margins = [sum(stage.margin for stage in stages[i:]) for i in range(len(stages) + 1)]
+    states = [stage.start(image, band_height) for stage in stages]
+    result = None
+
+    for top in range(0, height, band_height):
+        bottom = min(top + band_height, height)
+        first = max(top - margins[0], 0)
+        band = image.crop((0, first, width, min(bottom + margins[0], height)))
+
+        for i, stage in enumerate(stages):
+            if (call is None):
+                band, states[i] = stage.apply_band(band, first, states[i])
+            else:
+                band, states[i] = call(stage.name, stage.apply_band, band, first, states[i])
+
+            # drop the rows only this stage needed
+            start, end = max(top - margins[i + 1], 0), min(bottom + margins[i + 1], height)
+            if (start != first or end != first + band.height):
+                band = band.crop((0, start - first, width, end - first))
+            first = start
+
+        if (result is None):
+            result = Image.new(band.mode, (width, height))
+            if (band.mode == "P"):
+                result.putpalette(band.getpalette())
+
+        result.paste(band, (0, top))
+
+    return result
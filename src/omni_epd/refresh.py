@@ -0,0 +1,86 @@
+"""
+Copyright 2026 Rob Weber
+
+This file is part of omni-epd
+
+omni-epd is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""
+
+import time
+
+# the ways a frame can be written to a display
+REFRESH_SKIP = "skip"
+REFRESH_PARTIAL = "partial"
+REFRESH_FULL = "full"
+
+
+class RefreshPolicy:
+    """
+    Decides if each frame is skipped, drawn with a partial refresh or drawn with a full refresh, using the
+    refresh history of a display. Partial refreshes are faster and don't flash but leave ghosting behind,
+    a full refresh removes it. Each display has its own policy, created from the partial_update, partial_threshold,
+    max_partial_updates and full_refresh_interval options. Override choose() and attach with
+    VirtualEPD.set_refresh_policy() for a different policy
+    """
+
+    def __init__(self, partial_update=False, partial_threshold=0.25, max_partial_updates=5, full_refresh_interval=0):
+        """
+        :param partial_update: use partial refreshes when the display supports them
+        :param partial_threshold: largest part of the display, 0 - 1, that can change in a partial refresh
+        :param max_partial_updates: partial refreshes allowed before a full refresh is done
+        :param full_refresh_interval: seconds after a full refresh that another one is done, 0 for no limit
+        """
+        self.partial_update = partial_update
+        self.partial_threshold = partial_threshold
+        self.max_partial_updates = max_partial_updates
+        self.full_refresh_interval = full_refresh_interval
+
+        self.partial_count = 0  # partial refreshes since the last full refresh
+        self.last_full = None  # time.monotonic() of the last full refresh, None before the first one
+
+    def choose(self, changed, supported):
+        """ pick the refresh for the next frame
+        :param changed: part of the display, 0 - 1, that changed since the last frame. None if what is on
+        the display isn't known, like the first frame or after clear()
+        :param supported: the refresh types the display supports
+
+        :returns: REFRESH_SKIP, REFRESH_PARTIAL or REFRESH_FULL
+        """
+        if (changed is None or self.last_full is None):
+            return REFRESH_FULL
+
+        if (changed == 0):
+            return REFRESH_SKIP
+
+        if (not self.partial_update or REFRESH_PARTIAL not in supported):
+            return REFRESH_FULL
+
+        if (self.partial_count >= self.max_partial_updates):
+            return REFRESH_FULL
+
+        if (self.full_refresh_interval > 0 and time.monotonic() - self.last_full >= self.full_refresh_interval):
+            return REFRESH_FULL
+
+        return REFRESH_PARTIAL if changed <= self.partial_threshold else REFRESH_FULL
+
+    def record(self, refresh):
+        """ add a refresh that was done to the history
+        :param refresh: REFRESH_PARTIAL or REFRESH_FULL
+        """
+        if (refresh == REFRESH_FULL):
+            self.partial_count = 0
+            self.last_full = time.monotonic()
+        elif (refresh == REFRESH_PARTIAL):
+            self.partial_count += 1
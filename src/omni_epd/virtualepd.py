@@ -18,17 +18,58 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 """
 
+import concurrent.futures
+import functools
+import hashlib
 import json
 import importlib
 import logging
 import subprocess
+import threading
+import time
 import io
-import re
-import itertools
 from importlib_resources import path
-from PIL import Image, ImageEnhance, ImageColor
+from PIL import Image, ImageChops
 from . conf import EPD_CONFIG, IMAGE_DISPLAY, IMAGE_ENHANCEMENTS
 from . errors import EPDConfigurationError
+from . palette import Palette, BW_PALETTE, parse_palette
+from . refresh import RefreshPolicy, REFRESH_SKIP, REFRESH_PARTIAL, REFRESH_FULL
+from . pipeline import ConvertStage, TransformStage, ToneStage, EnhanceStage, DitherStage, FLIP_OPTIONS, TONE_OPTIONS, ENHANCEMENT_OPTIONS, run_bands
+
+# dither algorithms handled by didder, https://github.com/robweber/omni-epd/wiki/Image-Dithering-Options
+DITHER_MODES_ORDERED = ("clustereddot4x4", "clustereddotdiagonal8x8", "vertical5x3", "horizontal3x5",
+                        "clustereddotdiagonal6x6", "clustereddotdiagonal8x8_2", "clustereddotdiagonal16x16",
+                        "clustereddot6x6", "clustereddotspiral5x5", "clustereddothorizontalline",
+                        "clustereddotverticalline", "clustereddot8x8", "clustereddot6x6_2",
+                        "clustereddot6x6_3", "clustereddotdiagonal8x8_3")
+
+DITHER_MODES_DIFFUSION = ("simple2d", "floydsteinberg", "falsefloydsteinberg", "jarvisjudiceninke", "atkinson",
+                          "stucki", "burkes", "sierra", "tworowsierra", "sierralite", "stevenpigeon", "sierra3",
+                          "sierra2", "sierra2_4a")
+
+DITHER_MODES = DITHER_MODES_ORDERED + DITHER_MODES_DIFFUSION + ("none", "bayer", "random", "customordered", "customdiffusion")
+
+# image modes didder can read from an uncompressed BMP, anything else is converted to RGB first
+DIDDER_INPUT_MODES = ("RGB", "L")
+
+# dither_engine options, auto uses the builtin engine for the algorithms it supports and didder for the rest
+DITHER_ENGINES = ("auto", "builtin", "didder")
+
+# public methods timed when an observer is attached, these are overridden by display classes
+OBSERVED_METHODS = ("prepare", "sleep", "clear", "close")
+
+# configuration sections that can be changed with apply_config() after a display is loaded
+RELOADABLE_SECTIONS = (IMAGE_DISPLAY, IMAGE_ENHANCEMENTS)
+
+
+@functools.lru_cache(maxsize=None)
+def didder_path():
+    """ resolve the path to the bundled didder binary, this is only done once
+
+    :returns: the path to didder as a string
+    """
+    with path("omni_epd", "didder") as p:
+        return str(p)
 
 
 class VirtualEPD:
@@ -48,6 +89,7 @@ class VirtualEPD:
     height = 0  # height of display
     mode = "bw"  # mode of the display, bw by default, others defined by display class
     modes_available = ("bw")  # modes this display supports, set in __init__
+    refresh_types = (REFRESH_FULL, )  # refresh types this display supports, add REFRESH_PARTIAL when _display_partial() is implemented
 
     # only used by displays that need palette filtering before sending to display driver
     max_colors = 2  # assume only b+w supported by default, set in __init__
@@ -56,12 +98,37 @@ class VirtualEPD:
     _device = None  # concrete device class, initialize in __init__
     _config = None  # configuration options passed in via dict at runtime or .ini file
     _device_name = ""  # name of this device
+    _pipeline = None  # tuple of image pipeline stages, created by compile_pipeline()
+    _palette = None  # Palette object for this display, created by compile_pipeline()
+
+    # dither options, parsed by compile_pipeline()
+    _dither_strength = "1.0"
+    _dither_serpentine = False
+    _dither_args = None
+    _ditherer = None  # Ditherer used instead of didder, None if didder is used
+    _skip_unchanged = False  # if display() should skip frames that match the last one, parsed by compile_pipeline()
+    _band_height = 0  # rows in each band when images are processed in bands, 0 to process the full image, parsed by compile_pipeline()
+    _last_frame = None  # digest of the last frame sent to _display()
+    _executor = None  # single thread executor used by the _async methods, created when first needed
+    _observer = None  # DisplayObserver that receives timing events, set with set_observer()
+    _frame_cache = None  # FrameCache for processed images, set with set_frame_cache()
+    _cache_settings = ""  # the settings used to process images, part of the frame cache keys, set by compile_pipeline()
+    _refresh_policy = None  # RefreshPolicy that picks the refresh for each frame, created in __init__ or set with set_refresh_policy()
+    _last_image = None  # last frame sent to the display, kept to find the changed area when partial refreshes are used
 
     def __init__(self, deviceName, config):
         self._config = config
         self._device_name = deviceName
 
+        # copy so changes made by display classes don't leak to other instances
+        self.palette_filter = list(self.palette_filter)
+
         self._logger = logging.getLogger(self.__str__())
+        self._executor_lock = threading.Lock()
+
+        # held while the options are compiled and while display() copies them, images aren't processed or drawn
+        # with it held so a reload from another thread doesn't wait for the display
+        self._config_lock = threading.RLock()
 
         # set the display mode
         self.mode = self._get_device_option('mode', self.mode)
@@ -70,79 +137,402 @@ class VirtualEPD:
             self._logger.warn("The mode 'black' is deprecated, 'bw' should be used instead. This will be removed in a future release.")
             self.mode = 'bw'
 
+        self._refresh_policy = self.__load_refresh_policy()
+
     def __str__(self):
         return f"{self.pkg_name}.{self._device_name}"
 
-    def __parse_palette(self, color_str):
-        """ parse the color infomration to return a RGB color from a color string
-        :param color_str: the color as either a hex value (#000000), RGB list [R,G,B] or color name (blue, red)
-        :raises ValueError: if the color string is in an invalid format
+    def __load_refresh_policy(self):
+        """ create the RefreshPolicy from the partial refresh options
+        :raises EPDConfigurationError: if an option can't be parsed or is out of range
+        :returns: a RefreshPolicy object
+        """
+        threshold = self._getfloat_device_option('partial_threshold', 0.25)
+        if (not 0 <= threshold <= 1):
+            raise EPDConfigurationError(self.getName(), "partial_threshold", threshold)
+
+        max_partial_updates = self._getint_device_option('max_partial_updates', 5)
+        if (max_partial_updates < 0):
+            raise EPDConfigurationError(self.getName(), "max_partial_updates", max_partial_updates)
+
+        interval = self._getfloat_device_option('full_refresh_interval', 0)
+        if (interval < 0):
+            raise EPDConfigurationError(self.getName(), "full_refresh_interval", interval)
+
+        return RefreshPolicy(self._getboolean_device_option('partial_update', False), threshold, max_partial_updates, interval)
+
+    def __load_palette(self):
+        """ parse and validate the palette_filter option, or the palette set by the display class
+
+        :raises EPDConfigurationError: if the palette is invalid or has more colors than the display can support
+        :returns: a Palette object
+        """
+        # load palette as string - this is a catch in case it was changed by the user
+        colors = self._get_device_option('palette_filter', json.dumps(self.palette_filter))
+
+        try:
+            palette = Palette(parse_palette(colors))
+        except ValueError:
+            raise EPDConfigurationError(self.getName(), "palette_filter", colors)
+
+        # check if we have too many colors in the palette
+        if (len(palette) == 0 or len(palette) > self.max_colors):
+            raise EPDConfigurationError(self.getName(), "palette_filter", f"{len(palette)} colors")
+
+        return palette
+
+    def _get_palette(self):
+        """ returns the Palette for this display, parsed from the palette_filter option by compile_pipeline() """
+        if (self._palette is None):
+            self.compile_pipeline()
+
+        return self._palette
+
+    def __get_config_value(self, section, option, getter):
+        """ get a typed value from the configuration, converting parse errors to an EPDConfigurationError
+        :param section: the configuration section
+        :param option: the option name
+        :param getter: the ConfigParser method used to get the value (getfloat, getboolean, etc)
+
+        :raises EPDConfigurationError: if the value can't be parsed
+        :returns: the value, or None if the option doesn't exist
+        """
+        try:
+            return getter(section, option, fallback=None)
+        except ValueError:
+            raise EPDConfigurationError(self.getName(), option, self._config.get(section, option, raw=True))
+
+    def compile_pipeline(self):
+        """
+        Parse and validate the options from the global configuration that should apply to all images
+        before writing to the epd. These are turned into a list of pipeline stages so display() doesn't
+        need to read the configuration for each image. This is done when the display is loaded, call it again
+        if the configuration changes after that.
 
-        :returns: the color_str converted to a list of RGB values
+        :raises EPDConfigurationError: if an option has an invalid value
+        :returns: a tuple of PipelineStage objects
         """
-        if re.match(r'#[a-fA-F0-9]{6}', color_str) or color_str.lower() in ImageColor.colormap:
-            return ImageColor.getrgb(color_str)
-        elif re.match(r'\[?(\d{1,3}),(\d{1,3}),(\d{1,3})\]?', color_str):
-            return list(map(int, re.findall(r'\d{1,3}', color_str)))
+        with self._config_lock:
+            return self.__compile_pipeline()
+
+    def __compile_pipeline(self):
+        stages = []
+
+        self._palette = self.__load_palette()
+
+        # displays that only show greys work on L images from the start, instead of RGB
+        if (self.mode == 'bw' or self._palette.grayscale):
+            stages.append(ConvertStage("L"))
+
+        # rotation and flips are done as one transform
+        rotate = self.__get_config_value(IMAGE_DISPLAY, "rotate", self._config.getfloat) or 0
+        flips = [bool(self.__get_config_value(IMAGE_DISPLAY, option, self._config.getboolean)) for option, _ in FLIP_OPTIONS]
+
+        transform = TransformStage(rotate, *flips)
+        if (not transform.identity):
+            stages.append(transform)
+
+        # contrast, brightness and gamma are done as one lookup table
+        tone = [self.__get_config_value(IMAGE_ENHANCEMENTS, option, self._config.getfloat) for option in TONE_OPTIONS]
+        if (tone[2] is not None and tone[2] <= 0):
+            raise EPDConfigurationError(self.getName(), "gamma", tone[2])
+
+        if (any(factor is not None for factor in tone)):
+            stages.append(ToneStage(*tone))
+
+        for option, enhancer in ENHANCEMENT_OPTIONS:
+            factor = self.__get_config_value(IMAGE_ENHANCEMENTS, option, self._config.getfloat)
+            if (factor is not None):
+                stages.append(EnhanceStage(option, enhancer, factor))
+
+        dither = self._config.get(IMAGE_DISPLAY, "dither", fallback="")
+        if (dither):
+            dither = dither.lower().replace("sierra-2-4a", "sierralite").replace("-", "")
+
+            if (dither not in DITHER_MODES):
+                raise EPDConfigurationError(self.getName(), "dither", dither)
+
+            # validate the other dither options now, they're passed to didder as strings
+            self.__get_config_value(IMAGE_DISPLAY, "dither_strength", self._config.getfloat)
+            self._dither_strength = self._config.get(IMAGE_DISPLAY, 'dither_strength', raw=True, fallback='1.0')
+            self._dither_serpentine = bool(self.__get_config_value(IMAGE_DISPLAY, "dither_serpentine", self._config.getboolean))
+            self._dither_args = self._config.get(IMAGE_DISPLAY, 'dither_args', fallback=None)
+            self._ditherer = self.__load_ditherer(dither)
+
+            # the stage keeps the settings it was compiled with, images already being processed aren't changed by a reload
+            stages.append(DitherStage(dither, functools.partial(self.__dither, ditherer=self._ditherer, strength=self._dither_strength,
+                                                                serpentine=self._dither_serpentine, args=self._dither_args),
+                                      self._ditherer))
         else:
-            raise ValueError(f"Invalid color format: {color_str}")
+            self._dither_strength = VirtualEPD._dither_strength
+            self._dither_serpentine = VirtualEPD._dither_serpentine
+            self._dither_args = VirtualEPD._dither_args
+            self._ditherer = None
+
+        stages.extend(self._get_device_stages())
+
+        self._skip_unchanged = bool(self.__get_config_value(IMAGE_DISPLAY, "skip_unchanged", self._config.getboolean))
+
+        band_height = self.__get_config_value(IMAGE_DISPLAY, "band_height", self._config.getint) or 0
+        if (band_height < 0):
+            raise EPDConfigurationError(self.getName(), "band_height", band_height)
+
+        self._band_height = band_height
+
+        self._pipeline = tuple(stages)
+        self._cache_settings = repr((self.mode, tuple(map(str, self._pipeline)), self._palette.colors, self._dither_strength,
+                                     self._dither_serpentine, self._dither_args, type(self._ditherer).__name__))
+        self._logger.debug(f"Image pipeline: {', '.join(map(str, self._pipeline))}")
+
+        return self._pipeline
+
+    def apply_config(self, config):
+        """
+        Replace the [Display] and [Image Enhancements] options with the ones from another configuration
+        and compile the pipeline again. The device is not reopened, changes to other sections are ignored.
+        Images that are already being processed or drawn keep the options they started with.
+
+        :param config: a ConfigParser object with the new options
+        :raises EPDConfigurationError: if a new option is invalid, the current options are kept
+        :returns: True if any options changed
+        """
+        with self._config_lock:
+            current = {s: self.__section_options(self._config, s) for s in RELOADABLE_SECTIONS}
+            changed = {s: self.__section_options(config, s) for s in RELOADABLE_SECTIONS}
 
-    def __generate_palette(self, colors):
-        """ generate a palette given the colors available for this display
-        :param colors: a list of valid colors as a string
+            if (current == changed):
+                return False
 
-        :returns: a list of tuples representing RGB values
+            self.__replace_sections(changed)
+
+            try:
+                self.compile_pipeline()
+            except EPDConfigurationError:
+                self.__replace_sections(current)
+                self.compile_pipeline()
+                raise
+
+            # the next frame uses the new options, so it shouldn't be skipped
+            self._last_frame = None
+
+        self._logger.info("Configuration reloaded")
+
+        return True
+
+    def __section_options(self, config, section):
+        return dict(config.items(section, raw=True)) if config.has_section(section) else None
+
+    def __replace_sections(self, sections):
+        for section, options in sections.items():
+            self._config.remove_section(section)
+
+            if (options is not None):
+                self._config.read_dict({section: options})
+
+    def __load_ditherer(self, dither):
+        """ create the builtin Ditherer for the dither algorithm based on the dither_engine option
+        :param dither: the dither algorithm name
+
+        :raises EPDConfigurationError: if the engine is invalid or can't be used with this algorithm
+        :returns: a Ditherer object, or None if didder should be used
         """
-        result = colors.replace(" ", "")
-        result = re.findall(fr'#[a-fA-F0-9]{{6}}|\[?\d{{1,3}},\d{{1,3}},\d{{1,3}}\]?|{"|".join(ImageColor.colormap.keys())}', result, re.IGNORECASE)
-        result = list(map(self.__parse_palette, result))
+        engine = self._config.get(IMAGE_DISPLAY, "dither_engine", fallback="auto").lower()
+
+        if (engine not in DITHER_ENGINES):
+            raise EPDConfigurationError(self.getName(), "dither_engine", engine)
+
+        if (dither == "none" or engine == "didder"):
+            return None
+
+        from . import dithering
+
+        palette = BW_PALETTE if self.mode == 'bw' else self._palette
+
+        try:
+            result = dithering.load_ditherer(dither, palette, float(self._dither_strength), self._dither_serpentine, self._dither_args)
+        except (ValueError, TypeError, OSError):
+            raise EPDConfigurationError(self.getName(), "dither_args", self._dither_args)
+
+        if (result is None and engine == "builtin"):
+            raise EPDConfigurationError(self.getName(), "dither_engine", f"{engine} ({dither})")
+
+        if (isinstance(result, dithering.ErrorDiffusionDitherer)):
+            # error diffusion is a loop over the rows and columns in the builtin engine, ordered and random dithering
+            # are done on the whole image at once. didder is faster for error diffusion unless builtin is required
+            if (engine == "auto"):
+                return None
+
+            if (self._dither_serpentine):
+                self._logger.warning("Serpentine error diffusion is done one pixel at a time by the builtin engine and is very slow")
 
         return result
 
-    def __applyConfig(self, image):
+    def __swaps_axes(self):
+        """ returns True if the configured rotation swaps the width and height of images """
+        if (self._pipeline is None):
+            self.compile_pipeline()
+
+        return any(isinstance(s, TransformStage) and s.swaps_axes for s in self._pipeline)
+
+    @property
+    def logical_width(self):
+        """ the width of images passed to display(), this is the display height when rotating by 90 or 270 degrees """
+        return self.height if self.__swaps_axes() else self.width
+
+    @property
+    def logical_height(self):
+        """ the height of images passed to display(), this is the display width when rotating by 90 or 270 degrees """
+        return self.width if self.__swaps_axes() else self.height
+
+    def __compiled(self):
+        """ copy the compiled options used to process and draw an image, the lock is only held while they're copied
+        so an image is processed and drawn with the same options even if apply_config() is called part way through
+
+        :returns: a tuple of the pipeline stages, frame cache settings, band height and skip_unchanged option
+        """
+        with self._config_lock:
+            if (self._pipeline is None):
+                self.compile_pipeline()
+
+            return (self._pipeline, self._cache_settings, self._band_height, self._skip_unchanged)
+
+    def __applyConfig(self, image, compiled):
         """
-        Apply any values passed in from the global configuration that should
-        apply to all images before writing to the epd
+        Apply the compiled pipeline stages to the image before writing to the epd
 
         :param image: an Image object
+        :param compiled: the compiled options from __compiled()
 
         :returns: the modified image
         """
+        stages, settings, band_height, _ = compiled
 
-        if (self._config.has_option(IMAGE_DISPLAY, "rotate")):
-            image = image.rotate(self._config.getfloat(IMAGE_DISPLAY, "rotate"))
-            self._logger.debug(f"Rotating image {self._config.getfloat(IMAGE_DISPLAY, 'rotate')}")
+        if (self._frame_cache is not None):
+            return self.__cached(settings, image, self.__run_pipeline, stages, band_height)
 
-        if (self._config.has_option(IMAGE_DISPLAY, "flip_horizontal") and self._config.getboolean(IMAGE_DISPLAY, "flip_horizontal")):
-            image = image.transpose(method=Image.Transpose.FLIP_LEFT_RIGHT)
-            self._logger.debug("Flipping image horizontally")
+        return self.__run_pipeline(image, stages, band_height)
 
-        if (self._config.has_option(IMAGE_DISPLAY, "flip_vertical") and self._config.getboolean(IMAGE_DISPLAY, "flip_vertical")):
-            image = image.transpose(method=Image.Transpose.FLIP_TOP_BOTTOM)
-            self._logger.debug("Flipping image vertically")
+    def __run_pipeline(self, image, stages, band_height):
+        bands = ()
 
-        if (self._config.has_option(IMAGE_ENHANCEMENTS, "contrast")):
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(self._config.getfloat(IMAGE_ENHANCEMENTS, "contrast"))
-            self._logger.debug(f"Applying contrast: {self._config.getfloat(IMAGE_ENHANCEMENTS, 'contrast')}")
+        if (band_height and image.height > band_height):
+            # everything up to the last stage that needs the full image, like rotation, is run on the full image
+            # and the rest in bands. stages before it that could be banded, like the grey conversion, are run in full too
+            split = max((i + 1 for i, stage in enumerate(stages) if stage.margin is None), default=0)
+            stages, bands = stages[:split], stages[split:]
 
-        if (self._config.has_option(IMAGE_ENHANCEMENTS, "brightness")):
-            enhancer = ImageEnhance.Brightness(image)
-            image = enhancer.enhance(self._config.getfloat(IMAGE_ENHANCEMENTS, "brightness"))
-            self._logger.debug(f"Applying brightness: {self._config.getfloat(IMAGE_ENHANCEMENTS, 'brightness')}")
+        for stage in stages:
+            if (self._observer is None):
+                image = stage.apply(image)
+            else:
+                image = self.__observe(stage.name, stage.apply, image)
 
-        if (self._config.has_option(IMAGE_ENHANCEMENTS, "sharpness")):
-            enhancer = ImageEnhance.Sharpness(image)
-            image = enhancer.enhance(self._config.getfloat(IMAGE_ENHANCEMENTS, "sharpness"))
-            self._logger.debug(f"Applying sharpness: {self._config.getfloat(IMAGE_ENHANCEMENTS, 'sharpness')}")
+            self._logger.debug("Applied %s", stage)
 
-        if (self._config.has_option(IMAGE_DISPLAY, "dither") and self._config.get(IMAGE_DISPLAY, "dither")):
-            dither = self._config.get(IMAGE_DISPLAY, "dither").lower().replace("sierra-2-4a", "sierralite").replace("-", "")
-            image = self._ditherImage(image, dither)
-            self._logger.debug(f"Applying dither: {dither}")
+        if (bands):
+            image = run_bands(bands, image, band_height, self.__observe if self._observer is not None else None)
+            self._logger.debug("Applied %s in bands of %d rows", ", ".join(map(str, bands)), band_height)
 
         return image
 
+    def __cached(self, settings, image, method, *args):
+        """ get the result of method(image, *args) from the frame cache, or run it and add the result to the cache
+        :param settings: a string with all the settings that change the result
+        :param image: an Image object
+        :param method: the method to run if the image isn't cached
+        :param args: other arguments for the method
+
+        :returns: the processed image
+        """
+        key = self._frame_cache.make_key(image, settings)
+        result = self._frame_cache.get(key)
+
+        if (result is None):
+            result = method(image, *args)
+            self._frame_cache.put(key, result)
+
+        return result
+
+    def set_frame_cache(self, cache):
+        """ use a FrameCache to reuse processed images, display() and _filterImage() return the cached image
+        when the same image is processed again with the same settings. One cache can be shared by several displays
+        :param cache: a FrameCache object, or None to stop caching
+        """
+        self._frame_cache = cache
+
+    def __observe(self, stage, method, *args):
+        """ run the method, sending events to the observer before and after
+        :param stage: the name of this step
+        :param method: the method to run
+        :param args: arguments for the method
+
+        :returns: the result of the method
+        """
+        self._observer.stage_started(self.getName(), stage)
+        start = time.perf_counter()
+
+        try:
+            return method(*args)
+        finally:
+            self._observer.stage_finished(self.getName(), stage, time.perf_counter() - start)
+
+    def set_observer(self, observer):
+        """ attach a DisplayObserver to receive events with the time taken by each pipeline stage and the
+        prepare, display, sleep, clear and close methods. Nothing is timed when no observer is attached
+        :param observer: a DisplayObserver object, or None to remove it
+        """
+        self._observer = observer
+
+        for name in OBSERVED_METHODS:
+            if (observer is None):
+                self.__dict__.pop(name, None)
+            else:
+                # wrap the method of the display class on this instance only
+                setattr(self, name, functools.partial(self.__observe, name, getattr(type(self), name).__get__(self)))
+
+    def set_refresh_policy(self, policy):
+        """ use a different RefreshPolicy to pick the refresh for each frame, replacing the one created from the options
+        :param policy: a RefreshPolicy object
+        """
+        self._refresh_policy = policy
+        self._last_image = None
+
+    def _reset_refresh(self):
+        """ forget the last frame sent to the display, the next frame is drawn with a full refresh and isn't skipped
+        by skip_unchanged. Displays should call this when the display is changed some other way, like clear()
+        """
+        self._last_image = None
+        self._last_frame = None
+
+    def __changed_area(self, image):
+        """ the part of the display that changed since the last frame
+        :param image: the Image object about to be sent to the display
+
+        :returns: the changed area, 0 - 1, or None if the last frame isn't known
+        """
+        if (self._last_image is None or self._last_image.size != image.size or self._last_image.mode != image.mode):
+            return None
+
+        box = ImageChops.difference(image, self._last_image).getbbox()
+        if (box is None):
+            return 0
+
+        changed = (box[2] - box[0]) * (box[3] - box[1]) / (image.width * image.height)
+        self._logger.debug(f"Changed area {box} is {changed:.1%} of the display")
+
+        return changed
+
+    def __frame_digest(self, image):
+        """ digest of the image after the pipeline is applied, used to find unchanged frames
+        :param image: an Image object
+
+        :returns: the digest as bytes
+        """
+        result = hashlib.blake2b(f"{image.mode} {image.size}".encode(), digest_size=16)
+        result.update(image.tobytes())
+
+        return result.digest()
+
     """
     helper methods to get custom config options, providing a fallback if needed
     avoids having to do constant has_option(), get() calls within device class
@@ -154,26 +544,33 @@ class VirtualEPD:
         else:
             return self._config.get(EPD_CONFIG, option, fallback=fallback)
 
+    def __get_device_value(self, option, getter, fallback):
+        """ get a typed device option from the section for this display, or the EPD section if it isn't set there
+        :param option: the option name
+        :param getter: the ConfigParser method used to get the value (getint, getfloat, etc)
+        :param fallback: the value returned if the option isn't set in either section
+
+        :raises EPDConfigurationError: if the value can't be parsed
+        :returns: the option value
+        """
+        section = self.getName() if self._config.has_option(self.getName(), option) else EPD_CONFIG
+
+        try:
+            return getter(section, option, fallback=fallback)
+        except ValueError:
+            raise EPDConfigurationError(self.getName(), option, self._config.get(section, option, raw=True))
+
     def _getint_device_option(self, option, fallback):
         # if exists in local config use that, otherwise check EPD section
-        if (self._config.has_option(self.getName(), option)):
-            return self._config.getint(self.getName(), option)
-        else:
-            return self._config.getint(EPD_CONFIG, option, fallback=fallback)
+        return self.__get_device_value(option, self._config.getint, fallback)
 
     def _getfloat_device_option(self, option, fallback):
         # if exists in local config use that, otherwise check EPD section
-        if (self._config.has_option(self.getName(), option)):
-            return self._config.getfloat(self.getName(), option)
-        else:
-            return self._config.getfloat(EPD_CONFIG, option, fallback=fallback)
+        return self.__get_device_value(option, self._config.getfloat, fallback)
 
     def _getboolean_device_option(self, option, fallback):
         # if exists in local config use that, otherwise check EPD section
-        if (self._config.has_option(self.getName(), option)):
-            return self._config.getboolean(self.getName(), option)
-        else:
-            return self._config.getboolean(EPD_CONFIG, option, fallback=fallback)
+        return self.__get_device_value(option, self._config.getboolean, fallback)
 
     def _filterImage(self, image, dither=Image.Dither.FLOYDSTEINBERG, force_palette=False):
         """ Converts image to b/w or attempts a palette filter based on allowed colors in the display
@@ -183,35 +580,41 @@ class VirtualEPD:
         :raises EPDConfigurationError: if more colors are given in the palette than the display can support
         :returns: the image with the palette filtering applied
         """
+        if (self._frame_cache is not None):
+            settings = repr(("filter", self.mode, dither, force_palette, self._get_palette().colors))
+            return self.__cached(settings, image, self.__filter, dither, force_palette)
+
+        return self.__filter(image, dither, force_palette)
+
+    def __filter(self, image, dither, force_palette):
         if (self.mode == 'bw' and not force_palette):
             image = image.convert("1", dither=dither)
         else:
-            # load palette as string - this is a catch in case it was changed by the user
-            colors = self._get_device_option('palette_filter', json.dumps(self.palette_filter))
-            colors = self.__generate_palette(colors)
+            palette = self._get_palette()
 
-            # check if we have too many colors in the palette
-            if (len(colors) > self.max_colors):
-                raise EPDConfigurationError(self.getName(), "palette_filter", f"{len(colors)} colors")
+            if (image.mode == 'L' and palette.grayscale and palette.matches(image)):
+                # grey images that only have palette colors, like dithered images, are mapped to the palette with a lookup table
+                image = image.point(palette.index_table)
+                image.putpalette(palette.image.getpalette())
 
-            # create a new image to define the palette
-            palette_image = Image.new("P", (1, 1))
-
-            # set the palette, set all other colors to 0
-            palette = list(itertools.chain.from_iterable(colors))
-            palette_image.putpalette(palette + [0, 0, 0] * (256 - len(colors)))
+                return image
 
             if (image.mode != 'RGB'):
-                # convert to RGB as quantize requires it
+                # convert to RGB as quantize requires it, L images aren't mapped to the palette colors
                 image = image.convert(mode='RGB')
 
+            # images that only have palette colors, like dithered images, map to the palette the same way without
+            # dithering. Pillow looks up the nearest color in a cached color cube, this skips the error diffusion
+            if (dither != Image.Dither.NONE and palette.matches(image)):
+                dither = Image.Dither.NONE
+
             # apply the palette
-            image = image.quantize(palette=palette_image, dither=dither)
+            image = image.quantize(palette=palette.image, dither=dither)
 
         return image
 
     def _ditherImage(self, image, dither):
-        """ apply a dithering effect to the image using the didder library
+        """ apply a dithering effect to the image using the builtin engine or the didder library
         https://github.com/robweber/omni-epd/wiki/Image-Dithering-Options
         :param image: an Image object
         :param dither: dithering effect as a string
@@ -219,60 +622,42 @@ class VirtualEPD:
         :raises EPDConfigurationError: if more colors are given in the palette than the display can support
         :returns: the image with the effect applied
         """
-        dither_modes_ordered = ("clustereddot4x4", "clustereddotdiagonal8x8", "vertical5x3", "horizontal3x5",
-                                "clustereddotdiagonal6x6", "clustereddotdiagonal8x8_2", "clustereddotdiagonal16x16",
-                                "clustereddot6x6", "clustereddotspiral5x5", "clustereddothorizontalline",
-                                "clustereddotverticalline", "clustereddot8x8", "clustereddot6x6_2",
-                                "clustereddot6x6_3", "clustereddotdiagonal8x8_3")
+        return self.__dither(image, dither, self._ditherer, self._dither_strength, self._dither_serpentine, self._dither_args)
 
-        dither_modes_diffusion = ("simple2d", "floydsteinberg", "falsefloydsteinberg", "jarvisjudiceninke", "atkinson",
-                                  "stucki", "burkes", "sierra", "tworowsierra", "sierralite", "stevenpigeon", "sierra3",
-                                  "sierra2", "sierra2_4a")
+    def __dither(self, image, dither, ditherer, strength, serpentine, args):
+        if (ditherer is not None):
+            return ditherer.dither(image)
 
-        if (self.mode == 'bw'):
-            colors = [[255, 255, 255], [0, 0, 0]]
-        else:
-            # load palette - this is a catch in case it was changed by the user
-            colors = self._get_device_option('palette_filter', json.dumps(self.palette_filter))
-            colors = self.__generate_palette(colors)
+        palette = BW_PALETTE if self.mode == 'bw' else self._get_palette()
 
-            # check if we have too many colors in the palette
-            if (len(colors) > self.max_colors):
-                raise EPDConfigurationError(self.getName(), "palette_filter", f"{len(colors)} colors")
-
-        # format palette the way didder expects it
-        palette = [",".join(map(str, x)) for x in colors]
-        palette = " ".join(palette)
-        with path("omni_epd", "didder") as p:
-            didder = p
-
-        cmd = [didder, "--in", "-", "--out", "-", "--palette", palette]
-        cmd += ["--strength", self._config.get(IMAGE_DISPLAY, 'dither_strength', raw=True, fallback='1.0')]
+        # images are passed as BMP and returned as uncompressed PNG to skip the compression costs
+        cmd = [didder_path(), "--in", "-", "--out", "-", "--compression", "no", "--palette", palette.didder_arg]
+        cmd += ["--strength", strength]
 
         if (dither == "none"):
             return self._filterImage(image, Image.Dither.NONE)
-        elif (dither in dither_modes_ordered):
+        elif (dither in DITHER_MODES_ORDERED):
             cmd += ["odm", dither]
-        elif (dither in dither_modes_diffusion):
+        elif (dither in DITHER_MODES_DIFFUSION):
             cmd += ["edm", dither]
         elif (dither == "bayer"):
             # dither_args: X,Y dimensions of bayer matrix - powers of two, 3x3, 3x5, or 5x3
-            cmd += ["bayer", self._config.get(IMAGE_DISPLAY, 'dither_args', fallback='4,4')]
+            cmd += ["bayer", args or '4,4']
         elif (dither == "random"):
             # dither_args: min,max or min_r,max_r,min_g,max_g,min_b,max_b
-            cmd += ["random", self._config.get(IMAGE_DISPLAY, 'dither_args', fallback='-0.5,0.5')]
+            cmd += ["random", args or '-0.5,0.5']
         elif (dither == "customordered"):
             # dither_args: JSON file or string
-            cmd += ["odm", self._config.get(IMAGE_DISPLAY, 'dither_args', fallback='')]
+            cmd += ["odm", args or '']
         elif (dither == "customdiffusion"):
             # dither_args: JSON file or string
-            cmd += ["edm", self._config.get(IMAGE_DISPLAY, 'dither_args', fallback='')]
+            cmd += ["edm", args or '']
 
-        if (cmd[-2] == "edm" and self._config.getboolean(IMAGE_DISPLAY, 'dither_serpentine', fallback=False)):
+        if (cmd[-2] == "edm" and serpentine):
             cmd.insert(-1, "--serpentine")
 
         with io.BytesIO() as buf:
-            image.save(buf, "PNG")
+            (image if image.mode in DIDDER_INPUT_MODES else image.convert("RGB")).save(buf, "BMP")
             proc = subprocess.run(cmd, input=buf.getvalue(), capture_output=True)
 
         if (proc.returncode):
@@ -280,7 +665,7 @@ class VirtualEPD:
             return image
 
         with io.BytesIO(proc.stdout) as buf:
-            image = Image.open(buf).convert("RGB")
+            image = Image.open(buf).convert("L" if palette.grayscale else "RGB")
 
         return image
 
@@ -313,26 +698,143 @@ class VirtualEPD:
         """
         raise NotImplementedError
 
+    def _get_device_stages(self):
+        """ OPTIONAL - pipeline stages the display needs, run after the configured options
+        :returns: a list of PipelineStage objects
+        """
+        return []
+
+    def _display_partial(self, image):
+        """ OPTIONAL - display code for a partial refresh, only used when REFRESH_PARTIAL is in refresh_types
+        :raises NotImplementedError: if not implemented by child class
+        """
+        raise NotImplementedError
+
     def prepare(self):
         """ OPTIONAL - run at the top of each update to do required pre-work """
         return True
 
-    def display(self, image):
+    def display(self, image, force=False):
         """ Called to draw an image on the display, this applies configured effects
         DON'T override this method directly, use _display() in child classes
 
         :param image: an Image object
+        :param force: draw the image with a full refresh, even if it matches the last image
+
+        :returns: True if the image was drawn, False if it was skipped because it didn't change
         """
-        self._display(self.__applyConfig(image))
+        compiled = self.__compiled()
+
+        return self.__write_frame(self.__applyConfig(image, compiled), force, compiled[3])
+
+    def __write_frame(self, image, force, skip_unchanged):
+        """ write an image that has already been through the pipeline to the display, the refresh policy
+        picks if it is skipped or drawn with a partial or full refresh
+        :param image: an Image object
+        :param force: draw the image with a full refresh, even if it matches the last image
+        :param skip_unchanged: skip the image if it matches the last one, the option the image was processed with
+
+        :returns: True if the image was drawn, False if it was skipped
+        """
+        digest = None
+        if (skip_unchanged):
+            digest = self.__frame_digest(image)
+
+            if (not force and digest == self._last_frame):
+                self._logger.debug("Image unchanged, skipping display")
+                return False
+
+        # the changed area is only found when partial_update is set, frames that didn't change are then skipped on
+        # every display and the policy picks partial refreshes for the displays that support them
+        partial = self._refresh_policy.partial_update
+        refresh = self._refresh_policy.choose(None if force or not partial else self.__changed_area(image), self.refresh_types)
+
+        if (refresh == REFRESH_SKIP):
+            self._logger.debug("Display unchanged, skipping refresh")
+            return False
+
+        self._logger.debug(f"Using {refresh} refresh")
+        method = self._display_partial if refresh == REFRESH_PARTIAL else self._display
+
+        if (self._observer is None):
+            method(image)
+        else:
+            self.__observe("display", method, image)
+
+        self._refresh_policy.record(refresh)
+        self._last_frame = digest
+        # a copy, the image may be the caller's and drawn on again before the next display()
+        self._last_image = image.copy() if partial else None
+
+        return True
 
     def sleep(self):
         """ OPTIONAL - put the display to sleep after each update, if device supports """
         return True
 
     def clear(self):
-        """ OPTIONAL - clear the display, if device supports """
+        """ OPTIONAL - clear the display, if device supports. Call _reset_refresh() so the next image is drawn """
+        self._reset_refresh()
         return True
 
     def close(self):
         """ OPTIONAL close out the device, called when the program ends """
         return True
+
+    """
+    non-blocking versions of the methods above, these run on a worker thread for this device and return a
+    concurrent.futures.Future. Calls are done in the order they're made. Use asyncio.wrap_future() to await them
+    """
+    def __submit(self, method, *args):
+        with self._executor_lock:
+            if (self._executor is None):
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.getName())
+
+            return self._executor.submit(method, *args)
+
+    def prepare_async(self):
+        """ run prepare() on the worker thread
+
+        :returns: a Future for the result of prepare()
+        """
+        return self.__submit(self.prepare)
+
+    def display_async(self, image, force=False):
+        """ apply configured effects to the image and draw it on the display from the worker thread
+        the effects are applied right away, this way the next image can be processed while the last one is drawn
+
+        :param image: an Image object
+        :param force: draw the image even if skip_unchanged is set and it matches the last image
+
+        :returns: a Future that is True if the image was drawn, False if it was skipped
+        """
+        compiled = self.__compiled()
+
+        return self.__submit(self.__write_frame, self.__applyConfig(image, compiled), force, compiled[3])
+
+    def sleep_async(self):
+        """ run sleep() on the worker thread
+
+        :returns: a Future for the result of sleep()
+        """
+        return self.__submit(self.sleep)
+
+    def clear_async(self):
+        """ run clear() on the worker thread
+
+        :returns: a Future for the result of clear()
+        """
+        return self.__submit(self.clear)
+
+    def close_async(self):
+        """ run close() on the worker thread, the worker thread is stopped once it is done
+
+        :returns: a Future for the result of close()
+        """
+        result = self.__submit(self.close)
+
+        with self._executor_lock:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+        return result
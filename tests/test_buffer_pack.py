@@ -0,0 +1,196 @@
+import unittest
+from PIL import Image
+from omni_epd.bufferpack import find_packer
+from omni_epd.pipeline import Gray4Stage, GRAY4_LEVELS
+
+# fake Waveshare drivers, the getbuffer methods are the same as the ones in the waveshare_epd package
+
+
+class FakeLoopDriver:
+    """ 1 bit buffer built one pixel at a time, 1 is white (epd2in9, epd4in2bc and most older drivers) """
+    width = 128
+    height = 296
+
+    def getbuffer(self, image):
+        buf = [0xFF] * (int(self.width / 8) * self.height)
+        image_monocolor = image.convert('1')
+        imwidth, imheight = image_monocolor.size
+        pixels = image_monocolor.load()
+        if (imwidth == self.width and imheight == self.height):
+            for y in range(imheight):
+                for x in range(imwidth):
+                    if pixels[x, y] == 0:
+                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
+        elif (imwidth == self.height and imheight == self.width):
+            for y in range(imheight):
+                for x in range(imwidth):
+                    newx = y
+                    newy = self.height - x - 1
+                    if pixels[x, y] == 0:
+                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
+        return buf
+
+    def getbuffer_4Gray(self, image):
+        buf = [0xFF] * (int(self.width / 4) * self.height)
+        image_monocolor = image.convert('L')
+        imwidth, imheight = image_monocolor.size
+        pixels = image_monocolor.load()
+        i = 0
+        if (imwidth == self.width and imheight == self.height):
+            for y in range(imheight):
+                for x in range(imwidth):
+                    if (pixels[x, y] == 0xC0):
+                        pixels[x, y] = 0x80
+                    elif (pixels[x, y] == 0x80):
+                        pixels[x, y] = 0x40
+                    i = i + 1
+                    if (i % 4 == 0):
+                        buf[int((x + (y * self.width)) / 4)] = ((pixels[x - 3, y] & 0xc0) | (pixels[x - 2, y] & 0xc0) >> 2 |
+                                                                (pixels[x - 1, y] & 0xc0) >> 4 | (pixels[x, y] & 0xc0) >> 6)
+        elif (imwidth == self.height and imheight == self.width):
+            for x in range(imwidth):
+                for y in range(imheight):
+                    newx = y
+                    newy = self.height - x - 1
+                    if (pixels[x, y] == 0xC0):
+                        pixels[x, y] = 0x80
+                    elif (pixels[x, y] == 0x80):
+                        pixels[x, y] = 0x40
+                    i = i + 1
+                    if (i % 4 == 0):
+                        buf[int((newx + (newy * self.width)) / 4)] = ((pixels[x, y - 3] & 0xc0) | (pixels[x, y - 2] & 0xc0) >> 2 |
+                                                                      (pixels[x, y - 1] & 0xc0) >> 4 | (pixels[x, y] & 0xc0) >> 6)
+        return buf
+
+
+class FakeInvertedDriver:
+    """ 1 bit buffer from Pillow with the bits inverted, 1 is black (epd7in5_V2), width isn't a multiple of 8 """
+    width = 122
+    height = 250
+
+    def getbuffer(self, image):
+        img = image
+        imwidth, imheight = img.size
+        if (imwidth == self.width and imheight == self.height):
+            img = img.convert('1')
+        elif (imwidth == self.height and imheight == self.width):
+            img = img.rotate(90, expand=True).convert('1')
+        else:
+            return [0x00] * (int(self.width / 8) * self.height)
+
+        buf = bytearray(img.tobytes('raw'))
+        for i in range(len(buf)):
+            buf[i] ^= 0xFF
+        return buf
+
+
+class FakeColorDriver:
+    """ 7 color display, 4 bit palette indexes after quantizing (epd7in3f) """
+    width = 200
+    height = 120
+
+    def getbuffer(self, image):
+        pal_image = Image.new("P", (1, 1))
+        pal_image.putpalette((0, 0, 0, 255, 255, 255, 0, 255, 0, 0, 0, 255, 255, 0, 0, 255, 255, 0, 255, 128, 0) + (0, 0, 0) * 249)
+
+        imwidth, imheight = image.size
+        if (imwidth == self.width and imheight == self.height):
+            image_temp = image
+        elif (imwidth == self.height and imheight == self.width):
+            image_temp = image.rotate(90, expand=True)
+
+        image_7color = image_temp.convert("RGB").quantize(palette=pal_image)
+        buf_7color = bytearray(image_7color.tobytes('raw'))
+
+        buf = [0x00] * int(self.width * self.height / 2)
+        idx = 0
+        for i in range(0, len(buf_7color), 2):
+            buf[idx] = (buf_7color[i] << 4) + buf_7color[i + 1]
+            idx += 1
+        return buf
+
+
+class FakeMirroredDriver(FakeLoopDriver):
+    """ driver with a layout none of the packers make, rows are mirrored """
+
+    def getbuffer(self, image):
+        buf = super().getbuffer(image.transpose(Image.Transpose.FLIP_LEFT_RIGHT))
+        return buf[::-1]
+
+
+class TestBufferPack(unittest.TestCase):
+
+    def images(self, driver):
+        """ a noisy color image in both orientations the drivers accept """
+        result = []
+        for size in ((driver.width, driver.height), (driver.height, driver.width)):
+            image = Image.effect_noise(size, 100).convert("RGB")
+            image.paste((255, 0, 0), (10, 10, 60, 40))
+            image.paste((0, 0, 255), (40, 60, 90, 110))
+            image.paste((192, 192, 192), (5, 70, 30, 110))
+            result.append(image)
+
+        return result
+
+    def check_driver(self, driver, method="getbuffer"):
+        packer = find_packer(driver, method)
+        self.assertIsNotNone(packer)
+
+        for image in self.images(driver):
+            expected = getattr(driver, method)(image)
+            result = packer(image)
+
+            self.assertEqual(type(result), type(expected))
+            self.assertEqual(bytes(result), bytes(expected))
+
+        # images that aren't the display size are left to the driver
+        self.assertIsNone(packer(Image.new("RGB", (10, 10))))
+
+    def test_loop_driver(self):
+        """
+        Confirm 1 bit buffers match a driver that sets each pixel in a loop
+        """
+        self.check_driver(FakeLoopDriver())
+
+    def test_inverted_driver(self):
+        """
+        Confirm 1 bit buffers match a driver that inverts the bits, with padded rows
+        """
+        self.check_driver(FakeInvertedDriver())
+
+    def test_gray4_driver(self):
+        """
+        Confirm 4 shade grayscale buffers match the driver
+        """
+        self.check_driver(FakeLoopDriver(), "getbuffer_4Gray")
+
+    def test_gray4_stage(self):
+        """
+        Confirm the gray4 stage only uses the display levels and gives the same buffers as the driver
+        """
+        driver = FakeLoopDriver()
+        packer = find_packer(driver, "getbuffer_4Gray")
+        stage = Gray4Stage()
+
+        for image in self.images(driver):
+            result = stage.apply(image)
+
+            self.assertEqual(result.mode, "L")
+            self.assertTrue(set(result.getdata()) <= set(GRAY4_LEVELS))
+            self.assertEqual(bytes(packer(result)), bytes(driver.getbuffer_4Gray(image)))
+
+            # images already reduced to the levels aren't changed
+            self.assertEqual(stage.apply(result).tobytes(), result.tobytes())
+
+    def test_color_driver(self):
+        """
+        Confirm palette index buffers match a 7 color driver
+        """
+        self.check_driver(FakeColorDriver())
+
+    def test_unknown_driver(self):
+        """
+        Confirm no packer is used when none match the driver
+        """
+        self.assertIsNone(find_packer(FakeMirroredDriver()))
+        self.assertIsNone(find_packer(FakeLoopDriver(), "getbuffer_7Color"))
@@ -0,0 +1,149 @@
+import sys
+import types
+import unittest
+from configparser import ConfigParser
+from unittest import mock
+from PIL import Image
+from omni_epd import EPDConfigurationError
+from omni_epd.displays.waveshare_display import WaveshareBWDisplay, IT8951Display
+
+# fake display drivers, these record the calls made to them instead of drawing anything
+
+
+class FakeWaveshareEPD:
+    """ driver with a partial update method, the same methods as waveshare_epd.epd2in13_V2 """
+    width = 16
+    height = 8
+
+    def __init__(self):
+        self.calls = []
+
+    def init(self, update=None):
+        self.calls.append(("init", update))
+
+    def getbuffer(self, image):
+        return image.convert("1").tobytes()
+
+    def display(self, buf):
+        self.calls.append(("display", buf))
+
+    def displayPartBaseImage(self, buf):
+        self.calls.append(("displayPartBaseImage", buf))
+
+    def displayPartial(self, buf):
+        self.calls.append(("displayPartial", buf))
+
+    def DisplayPartial(self, buf):
+        self.calls.append(("DisplayPartial", buf))
+
+
+class FakeAutoEPDDisplay:
+    """ the parts of IT8951.display.AutoEPDDisplay used by IT8951Display """
+    width = 40
+    height = 20
+
+    def __init__(self, vcom, spi_hz, rotate):
+        self.frame_buf = Image.new("L", (self.width, self.height), 0xFF)
+        self.calls = []
+
+    def draw_full(self, mode):
+        self.calls.append(("draw_full", mode))
+
+    def draw_partial(self, mode):
+        self.calls.append(("draw_partial", mode))
+
+    def clear(self):
+        self.calls.append(("clear", ))
+
+
+# values from IT8951.constants.DisplayModes
+FakeDisplayModes = types.SimpleNamespace(INIT=0, DU=1, GC16=2, GL16=3, A2=6)
+
+IT8951_MODULES = {"IT8951": types.ModuleType("IT8951"),
+                  "IT8951.display": types.SimpleNamespace(AutoEPDDisplay=FakeAutoEPDDisplay),
+                  "IT8951.constants": types.SimpleNamespace(DisplayModes=FakeDisplayModes)}
+
+
+def load_display(display_class, device, modules, options):
+    """ create a display with fake driver modules, the modules are only used while it is created """
+    config = ConfigParser()
+    config.read_dict({"EPD": options})
+
+    with mock.patch.dict(sys.modules, modules):
+        return display_class(device, config)
+
+
+def waveshare_modules(device):
+    return {"waveshare_epd": types.ModuleType("waveshare_epd"),
+            f"waveshare_epd.{device}": types.SimpleNamespace(EPD=FakeWaveshareEPD)}
+
+
+class TestDisplayDrivers(unittest.TestCase):
+
+    def test_waveshare_partial(self):
+        """
+        Confirm Waveshare displays switch between the full and partial update methods of the driver,
+        running the init methods each one needs
+        """
+        options = {"partial_update": "True", "max_partial_updates": "1", "fast_buffer": "False"}
+        epd = load_display(WaveshareBWDisplay, "epd2in13_V2", waveshare_modules("epd2in13_V2"), options)
+
+        image = Image.new("L", (epd.width, epd.height), 255)
+        changed = image.copy()
+        changed.paste(0, (0, 0, 2, 2))
+        full, partial = [epd._getbuffer(i) for i in (image, changed)]
+
+        epd.prepare()
+        assert epd.display(image) and epd.display(changed) and epd.display(image)
+
+        # the full update also sets the base image, the third update is full because of max_partial_updates
+        assert epd._device.calls == [("init", 0), ("displayPartBaseImage", full), ("init", 1), ("displayPartial", partial),
+                                     ("init", 0), ("displayPartBaseImage", full)]
+
+        # drivers without an init param for partial updates
+        epd = load_display(WaveshareBWDisplay, "epd2in9d", waveshare_modules("epd2in9d"), options)
+        assert epd.display(image) and epd.display(changed)
+        assert epd._device.calls == [("display", full), ("DisplayPartial", partial)]
+
+        # the normal display method is used without partial updates
+        epd = load_display(WaveshareBWDisplay, "epd2in13_V2", waveshare_modules("epd2in13_V2"), {"fast_buffer": "False"})
+        assert epd.display(image) and epd.display(changed)
+        assert epd._device.calls == [("display", full), ("display", partial)]
+
+    def test_it8951(self):
+        """
+        Confirm IT8951 images are drawn on a white frame aligned to the bottom right, with GC16 for full updates
+        and the fast waveform for partial updates that are only black and white
+        """
+        epd = load_display(IT8951Display, "it8951", IT8951_MODULES, {"mode": "gray16"})
+
+        # smaller images are padded with white, the display isn't cleared first
+        image = Image.new("L", (20, 10), 128)
+        assert epd.display(image)
+        assert epd._device.calls == [("draw_full", FakeDisplayModes.GC16)]
+
+        frame = epd._device.frame_buf
+        assert frame.crop((20, 10, 40, 20)).getcolors() == [(200, 128)]
+        assert sorted(frame.getcolors()) == [(200, 128), (600, 255)]
+
+        epd = load_display(IT8951Display, "it8951", IT8951_MODULES, {"mode": "gray16", "partial_update": "True"})
+        image = Image.new("L", (epd.width, epd.height), 255)
+        epd.display(image)
+
+        # black and white changes use the fast waveform, grey needs GC16
+        black = image.copy()
+        black.paste(0, (0, 0, 4, 4))
+        grey = black.copy()
+        grey.paste(128, (10, 10, 14, 14))
+
+        assert epd.display(black) and epd.display(grey)
+        assert epd._device.calls == [("draw_full", FakeDisplayModes.GC16), ("draw_partial", FakeDisplayModes.DU),
+                                     ("draw_partial", FakeDisplayModes.GC16)]
+        assert epd._device.frame_buf.tobytes() == grey.tobytes()
+
+        epd = load_display(IT8951Display, "it8951", IT8951_MODULES, {"mode": "gray16", "partial_update": "True", "fast_waveform": "a2"})
+        epd.display(image)
+        epd.display(black)
+        assert epd._device.calls[-1] == ("draw_partial", FakeDisplayModes.A2)
+
+        self.assertRaises(EPDConfigurationError, load_display, IT8951Display, "it8951", IT8951_MODULES, {"fast_waveform": "GC16"})
@@ -0,0 +1,71 @@
+import unittest
+import time
+from unittest import mock
+from PIL import Image
+from . import constants as constants
+from omni_epd import displayfactory, EPDUpdateError
+from omni_epd.displaymanager import DisplayManager
+
+# time each mock display takes to draw an image
+DISPLAY_TIME = 0.3
+
+
+class TestDisplayManager(unittest.TestCase):
+
+    def setUp(self):
+        config = {"EPD": {"write_file": "False"}}
+        self.displays = {f"panel{i}": displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config) for i in range(3)}
+        self.manager = DisplayManager(self.displays)
+        self.image = Image.new("RGB", (400, 200), "white")
+
+    def tearDown(self):
+        self.manager.close()
+
+    def slow_display(self, image):
+        time.sleep(DISPLAY_TIME)
+
+    def test_display_parallel(self):
+        """
+        Confirm all displays are updated at the same time
+        """
+        for epd in self.displays.values():
+            epd._display = mock.Mock(side_effect=self.slow_display)
+
+        start = time.perf_counter()
+        results = self.manager.update(self.image)
+        duration = time.perf_counter() - start
+
+        self.assertEqual(results, dict.fromkeys(self.displays, True))
+        self.assertLess(duration, DISPLAY_TIME * len(self.displays))
+
+        for epd in self.displays.values():
+            epd._display.assert_called_once()
+
+    def test_display_images(self):
+        """
+        Confirm a dict of images only updates the displays named
+        """
+        for epd in self.displays.values():
+            epd._display = mock.Mock()
+
+        results = self.manager.display({"panel1": self.image})
+
+        self.assertEqual(results, {"panel1": True})
+        self.displays["panel1"]._display.assert_called_once()
+        self.displays["panel0"]._display.assert_not_called()
+
+    def test_display_error(self):
+        """
+        Confirm an error on one display doesn't stop the others
+        """
+        for epd in self.displays.values():
+            epd._display = mock.Mock()
+        self.displays["panel1"]._display.side_effect = OSError("SPI write failed")
+
+        with self.assertRaises(EPDUpdateError) as context:
+            self.manager.display(self.image)
+
+        self.assertEqual(list(context.exception.errors), ["panel1"])
+        self.assertIsInstance(context.exception.errors["panel1"], OSError)
+        self.assertEqual(context.exception.results, {"panel0": True, "panel2": True})
+        self.displays["panel2"]._display.assert_called_once()
@@ -4,12 +4,34 @@ import time
 import json
 import glob
 import pytest
+import subprocess
+import sys
+import threading
+from configparser import ConfigParser
+from PIL import Image
+from unittest import mock
 from . import constants as constants
 from shutil import copyfile
 from omni_epd import EPDNotFoundError, EPDConfigurationError
 from omni_epd import displayfactory
 from omni_epd.virtualepd import VirtualEPD
-from omni_epd.conf import IMAGE_DISPLAY, CONFIG_FILE
+from omni_epd.displays.mock_display import MockDisplay
+from omni_epd.conf import IMAGE_DISPLAY, IMAGE_ENHANCEMENTS, CONFIG_FILE
+
+
+# seconds allowed to import displayfactory and load the mock display in a new process, only checked when
+# this environment variable is set since the time depends on the machine running the tests
+STARTUP_BUDGET = os.environ.get("OMNI_EPD_STARTUP_BUDGET")
+
+# imports the factory and loads the mock display, prints the time taken and the display modules imported
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from omni_epd import displayfactory
+displayfactory.load_display_driver('omni_epd.mock')
+print(time.perf_counter() - start)
+print(' '.join(m for m in sys.modules if m.startswith(('omni_epd.displays.', 'inky', 'waveshare_epd'))))
+"""
 
 
 class TestEpdLoading(unittest.TestCase):
@@ -39,6 +61,19 @@ class TestEpdLoading(unittest.TestCase):
 
         assert len(drivers) > 0
 
+    def test_display_registry(self):
+        """
+        Confirm the supported devices of each class are only looked up once,
+        listing and loading displays after that uses the registry
+        """
+        displayfactory.list_supported_displays()
+
+        with mock.patch.object(MockDisplay, 'get_supported_devices', side_effect=AssertionError("registry not used")):
+            self.assertIn(constants.GOOD_EPD_NAME, displayfactory.list_supported_displays())
+            self.assertIn({'package': MockDisplay.__module__, 'class': 'MockDisplay', 'devices': [constants.GOOD_EPD_NAME]},
+                          displayfactory.list_supported_displays(as_dict=True))
+            self.assertIsInstance(displayfactory.load_display_driver(constants.GOOD_EPD_NAME), MockDisplay)
+
     def test_loading_error(self):
         """
         Confirm error thrown if an invalid name passed to load function
@@ -127,3 +162,95 @@ class TestEpdLoading(unittest.TestCase):
 
         # load the display driver, shoudl throw EPDConfigurationError
         self.assertRaises(EPDConfigurationError, displayfactory.load_display_driver, constants.GOOD_EPD_NAME)
+
+    def test_lazy_display_imports(self):
+        """
+        Confirm that loading a display only imports the module for that display,
+        and stays within the startup time budget when OMNI_EPD_STARTUP_BUDGET is set
+        """
+        src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+        result = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True, check=True,
+                                env={**os.environ, "PYTHONPATH": src})
+        duration, modules = result.stdout.splitlines()
+        modules = modules.split()
+
+        if (STARTUP_BUDGET):
+            self.assertLess(float(duration), float(STARTUP_BUDGET))
+
+        self.assertIn("omni_epd.displays.mock_display", modules)
+        self.assertNotIn("omni_epd.displays.inky_display", modules)
+        self.assertNotIn("omni_epd.displays.waveshare_display", modules)
+        self.assertNotIn("inky", modules)
+
+    def test_reload_config(self):
+        """
+        Confirm changes to the config file are applied to a loaded display,
+        invalid changes raise an error and keep the current options
+        """
+        deviceConfig = os.path.join(os.getcwd(), constants.GOOD_EPD_NAME + ".ini")
+
+        def write_config(rotate, enhancements=""):
+            with open(deviceConfig, "w") as f:
+                f.write(f"[{IMAGE_DISPLAY}]\nrotate={rotate}\n[{IMAGE_ENHANCEMENTS}]\n{enhancements}\n")
+
+        write_config(90)
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME)
+        assert epd.logical_width == epd.height
+
+        # nothing changed
+        self.assertFalse(displayfactory.reload_config(epd))
+
+        write_config(0, "contrast=1.5")
+        self.assertTrue(displayfactory.reload_config(epd))
+        assert epd.logical_width == epd.width
+        assert [str(s) for s in epd._pipeline] == [str(s) for s in displayfactory.load_display_driver(constants.GOOD_EPD_NAME)._pipeline]
+        assert [s.name for s in epd._pipeline] == ["convert", "tone"]
+
+        write_config("bad")
+        self.assertRaises(EPDConfigurationError, displayfactory.reload_config, epd)
+        assert epd._config.getfloat(IMAGE_DISPLAY, 'rotate') == 0
+        assert [s.name for s in epd._pipeline] == ["convert", "tone"]
+
+    def test_reload_during_display(self):
+        """
+        Confirm options can be reloaded and the next image processed while an image is drawn, the image
+        being drawn keeps the options it started with. Removing the dither option also removes its settings
+        """
+        options = {"dither": "FloydSteinberg", "dither_engine": "builtin", "dither_strength": "0.5"}
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, {IMAGE_DISPLAY: options})
+        image = Image.new("RGB", (epd.width, epd.height), (128, 128, 128))
+        drawn = []
+        drawing = threading.Event()
+        done = threading.Event()
+
+        def draw(image):
+            drawn.append(image)
+            drawing.set()
+            done.wait(5)
+
+        config = ConfigParser()
+        config.read_dict({IMAGE_DISPLAY: {"rotate": "180"}})
+
+        with mock.patch.object(epd, "_display", side_effect=draw):
+            first = epd.display_async(image)
+            assert drawing.wait(5)
+
+            reload = threading.Thread(target=epd.apply_config, args=(config, ))
+            reload.start()
+            reload.join(1)
+
+            # neither the reload or the next image wait for the image being drawn
+            assert not reload.is_alive()
+            second = epd.display_async(image)
+            assert not first.done()
+
+            done.set()
+            assert first.result(5) and second.result(5)
+
+        assert epd._ditherer is None
+        assert epd._dither_strength == VirtualEPD._dither_strength
+        assert epd._config.getfloat(IMAGE_DISPLAY, "rotate") == 180
+
+        # the first image is dithered with the options it started with, the second isn't
+        assert {c for _, c in drawn[0].getcolors()} <= {0, 255}
+        assert drawn[1].getcolors() == [(epd.width * epd.height, 128)]
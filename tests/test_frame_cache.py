@@ -0,0 +1,80 @@
+import unittest
+import tempfile
+from unittest import mock
+from PIL import Image
+from . import constants as constants
+from omni_epd import displayfactory
+from omni_epd.framecache import FrameCache, image_size
+from omni_epd.pipeline import DitherStage
+
+
+class TestFrameCache(unittest.TestCase):
+
+    def setUp(self):
+        self.image = Image.new("RGB", (400, 200), "white")
+        self.image.paste("red", (50, 50, 150, 150))
+
+    def load_display(self, cache, **options):
+        config = {"EPD": {"write_file": "False"}, "Display": {"dither": "FloydSteinberg", "dither_engine": "builtin", **options}}
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+        epd.set_frame_cache(cache)
+
+        return epd
+
+    def process(self, epd):
+        # run the image through the pipeline without drawing it
+        return epd._VirtualEPD__applyConfig(self.image, epd._VirtualEPD__compiled())
+
+    def test_shared_cache(self):
+        """
+        Confirm displays with the same settings only process an image once
+        """
+        cache = FrameCache()
+        first = self.load_display(cache)
+        second = self.load_display(cache)
+
+        first.display(self.image)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))  # pipeline and filter
+
+        with mock.patch.object(DitherStage, "apply", side_effect=AssertionError("image processed again")):
+            second.display(self.image)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+        # different settings aren't shared
+        self.load_display(cache, rotate="90").display(self.image)
+        self.assertEqual(cache.misses, 4)
+
+        # the cached image is the same as an uncached one
+        expected = self.process(self.load_display(None))
+        self.assertEqual(self.process(first).tobytes(), expected.tobytes())
+
+    def test_eviction(self):
+        """
+        Confirm the least recently used images are removed once the cache is full
+        """
+        cache = FrameCache(max_size=image_size(self.image) * 2)
+
+        keys = [cache.make_key(self.image, str(i)) for i in range(3)]
+        for key in keys:
+            cache.put(key, self.image)
+
+        self.assertIsNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[2]))
+        self.assertEqual(cache.stats()["images"], 2)
+
+    def test_disk_cache(self):
+        """
+        Confirm cached images are saved to the directory and loaded by a new cache
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            key = FrameCache.make_key(self.image, "settings")
+            FrameCache(directory=directory).put(key, self.image.convert("P"))
+
+            cache = FrameCache(directory=directory)
+            image = cache.get(key)
+
+            self.assertEqual(image.tobytes(), self.image.convert("P").tobytes())
+            self.assertEqual(cache.stats()["hits"], 1)
+
+            cache.clear()
+            self.assertIsNone(FrameCache(directory=directory).get(key))
@@ -1,13 +1,21 @@
+import asyncio
 import unittest
 import os
 import time
 import glob
+import threading
+import tracemalloc
 import pytest
+from unittest import mock
 from . import constants as constants
-from PIL import Image, ImageChops
+from PIL import Image, ImageChops, ImageEnhance
 from shutil import copyfile
-from omni_epd import displayfactory
+from omni_epd import displayfactory, EPDConfigurationError
 from omni_epd.conf import CONFIG_FILE
+from omni_epd.displays.waveshare_display import tricolor_plane_tables
+from omni_epd.observer import TimingObserver
+from omni_epd.palette import Palette
+from omni_epd.pipeline import TransformStage, ToneStage, EnhanceStage, run_bands
 
 TEST_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__)))
 
@@ -70,6 +78,208 @@ class TestImageProcessing(unittest.TestCase):
 
         epd.display(image)
 
+    def test_compiled_pipeline(self):
+        """
+        Test that the image options are compiled into pipeline stages when the display is loaded
+        and that invalid values are caught at that time instead of when an image is displayed
+        """
+        self.setup_config(constants.ALL_IMAGE_OPTIONS, CONFIG_FILE)
+
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME)
+
+        stages = [type(s) for s in epd._pipeline]
+        assert stages == [TransformStage, ToneStage, EnhanceStage]
+
+        # changing the config requires the pipeline to be compiled again
+        epd._config.set("Image Enhancements", "contrast", "bad")
+        self.assertRaises(EPDConfigurationError, epd.compile_pipeline)
+
+        self.assertRaises(EPDConfigurationError, displayfactory.load_display_driver, constants.GOOD_EPD_NAME,
+                          {'Display': {'dither': 'not_a_dither'}})
+
+    def test_transform(self):
+        """
+        Test that right angle rotations and flips are done as one lossless transpose
+        and that rotating by 90 degrees swaps the logical width and height of the display
+        """
+        image = Image.open(constants.GALAXY_IMAGE).resize((30, 20))
+
+        for angle in (0, 90, 180, 270):
+            for flip_h in (False, True):
+                for flip_v in (False, True):
+                    expected = image.rotate(angle, expand=True)
+                    if (flip_h):
+                        expected = expected.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+                    if (flip_v):
+                        expected = expected.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+
+                    transform = TransformStage(angle, flip_h, flip_v)
+                    assert transform.method is not None or transform.identity
+
+                    result = transform.apply(image)
+                    assert result.size == expected.size
+                    assert ImageChops.difference(result, expected).getbbox() is None
+
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, {'Display': {'rotate': '90'}})
+        assert (epd.logical_width, epd.logical_height) == (epd.height, epd.width)
+
+        # image drawn in the rotated orientation fits the display
+        epd.display(self.open_image(constants.GALAXY_IMAGE, epd.logical_width, epd.logical_height))
+        assert Image.open(constants.MOCK_EPD_OUTPUT).size == (epd.width, epd.height)
+
+    def test_tone(self):
+        """
+        Test that contrast and brightness done as one lookup table match the ImageEnhance classes
+        """
+        image = self.open_image(constants.GALAXY_IMAGE, 400, 200)
+
+        for mode in ("RGB", "L", "RGBA"):
+            source = image.convert(mode)
+            expected = ImageEnhance.Brightness(ImageEnhance.Contrast(source).enhance(1.5)).enhance(1.2)
+
+            assert ToneStage(contrast=1.5, brightness=1.2).apply(source).tobytes() == expected.tobytes()
+
+        # gamma over 1 lightens the mid tones
+        table = ToneStage(gamma=2.2).table()
+        assert table[0] == 0 and table[255] == 255 and table[128] > 128
+
+        self.assertRaises(EPDConfigurationError, displayfactory.load_display_driver, constants.GOOD_EPD_NAME,
+                          {'Image Enhancements': {'gamma': '0'}})
+
+    def test_palette(self):
+        """
+        Test that the palette is parsed once when the display is loaded
+        and that too many colors for the display raises an error at that time
+        """
+        config = {'EPD': {'mode': 'palette', 'palette_filter': 'red, #00ff00, [0,0,255], black'}}
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+
+        palette = epd._get_palette()
+        assert palette.colors == ((255, 0, 0), (0, 255, 0), (0, 0, 255), (0, 0, 0))
+        assert palette.didder_arg == "255,0,0 0,255,0 0,0,255 0,0,0"
+
+        # same object is used for each image
+        epd.display(self.open_image(constants.GALAXY_IMAGE, epd.width, epd.height))
+        assert epd._get_palette() is palette
+
+        # only reloaded when the pipeline is compiled again
+        epd._config.set('EPD', 'palette_filter', 'white, black')
+        epd.compile_pipeline()
+        assert epd._get_palette().colors == ((255, 255, 255), (0, 0, 0))
+
+        config['EPD']['palette_filter'] = ", ".join(["[0,0,0]"] * 257)
+        self.assertRaises(EPDConfigurationError, displayfactory.load_display_driver, constants.GOOD_EPD_NAME, config)
+
+    def test_palette_match(self):
+        """
+        Test that images with only palette colors are filtered the same way without dithering
+        """
+        config = {'EPD': {'mode': 'palette', 'palette_filter': 'white, black, red, green, blue, yellow, orange'}}
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+        palette = epd._get_palette()
+
+        image = self.open_image(constants.GALAXY_IMAGE, epd.width, epd.height)
+        dithered = image.quantize(palette=palette.image).convert('RGB')
+
+        assert not palette.matches(image)
+        assert palette.matches(dithered)
+        assert not palette.matches(dithered.convert('L'))
+
+        expected = dithered.quantize(palette=palette.image, dither=Image.Dither.FLOYDSTEINBERG)
+        assert epd._filterImage(dithered).tobytes() == expected.tobytes()
+
+    def test_skip_unchanged(self):
+        """
+        Test that an image matching the last one displayed is skipped when skip_unchanged is set
+        """
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, {'Display': {'skip_unchanged': 'True'}})
+        image = self.open_image(constants.GALAXY_IMAGE, epd.width, epd.height)
+
+        assert epd.display(image)
+        os.remove(constants.MOCK_EPD_OUTPUT)
+
+        # same image isn't written again unless forced
+        assert not epd.display(image.copy())
+        assert not os.path.exists(constants.MOCK_EPD_OUTPUT)
+        assert epd.display(image, force=True)
+
+        assert epd.display(image.rotate(180))
+
+        # the same image is drawn again after the display is cleared
+        epd.clear()
+        assert epd.display(image.rotate(180))
+
+        # without the option every image is displayed
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME)
+        assert epd.display(image) and epd.display(image)
+
+    def test_display_async(self):
+        """
+        Test that the async methods run on the worker thread in order and can be awaited with asyncio
+        """
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, {'Display': {'skip_unchanged': 'True'}})
+        image = self.open_image(constants.GALAXY_IMAGE, epd.width, epd.height)
+
+        futures = [epd.prepare_async(), epd.display_async(image), epd.display_async(image), epd.sleep_async()]
+        assert [f.result(timeout=10) for f in futures[1:3]] == [True, False]
+
+        async def display():
+            return await asyncio.wrap_future(epd.display_async(image.rotate(180)))
+
+        assert asyncio.run(display())
+        assert os.path.exists(constants.MOCK_EPD_OUTPUT)
+
+        epd.close_async().result(timeout=10)
+
+        # the next image goes through the pipeline while the last one is still being drawn
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, {'Display': {'rotate': '180'}})
+        drawing = threading.Event()
+        done = threading.Event()
+
+        def draw(image):
+            drawing.set()
+            done.wait(5)
+
+        with mock.patch.object(epd, "_display", side_effect=draw), \
+             mock.patch.object(TransformStage, "apply", autospec=True, side_effect=TransformStage.apply) as transform:
+            first = epd.display_async(image)
+            assert drawing.wait(5)
+
+            second = epd.display_async(image.rotate(90))
+            assert transform.call_count == 2
+            assert not first.done()
+
+            done.set()
+            assert first.result(timeout=10) and second.result(timeout=10)
+
+        epd.close_async().result(timeout=10)
+
+    def test_observer(self):
+        """
+        Test that an observer gets the time taken by each pipeline stage and display method
+        """
+        self.setup_config(constants.ALL_IMAGE_OPTIONS, CONFIG_FILE)
+
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME)
+        image = self.open_image(constants.GALAXY_IMAGE, epd.width, epd.height)
+
+        observer = TimingObserver()
+        epd.set_observer(observer)
+
+        epd.prepare()
+        epd.display(image)
+        epd.close()
+
+        stages = [s for _, s in observer.timings]
+        assert stages == ["prepare", "transform", "tone", "sharpness", "display", "close"]
+        assert all(d == epd.getName() for d, _ in observer.timings)
+
+        # nothing is timed once removed
+        epd.set_observer(None)
+        epd.prepare()
+        epd.display(image)
+        assert len(observer.timings[(epd.getName(), "prepare")]) == 1
+
     def test_basic_dither(self):
         """
         Test that a basic dither algorithm can be applied - tests that result image is different than master (non-modified) image
@@ -86,6 +296,43 @@ class TestImageProcessing(unittest.TestCase):
         # compare the two images should be different (dither applied)
         assert not self.compare_images(constants.MOCK_EPD_OUTPUT, constants.MASTER_IMAGE)
 
+    def test_builtin_dither(self):
+        """
+        Test that dithering can be done by the builtin engine instead of didder
+        and that the result only contains colors from the palette
+        """
+        config = {'EPD': {'mode': 'palette', 'palette_filter': 'white, black, red'},
+                  'Display': {'dither_engine': 'builtin'}}
+
+        for dither, args in (('FloydSteinberg', None), ('Atkinson', None), ('ClusteredDot4x4', None), ('Bayer', '8,4'), ('Random', None),
+                             ('CustomOrdered', '{"matrix": [[0, 2], [3, 1]], "max": 4}')):
+            for serpentine in ('False', 'True'):
+                config['Display'].update({'dither': dither, 'dither_serpentine': serpentine, 'dither_args': args or ''})
+                epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+                assert epd._ditherer is not None
+
+                image = self.open_image(constants.GALAXY_IMAGE, 40, 30)
+                epd.display(image)
+
+                result = Image.open(constants.MOCK_EPD_OUTPUT).convert("RGB")
+                assert sorted(c for _, c in result.getcolors()) == [(0, 0, 0), (255, 0, 0), (255, 255, 255)]
+
+        config['Display']['dither_args'] = '{"max": 4}'
+        self.assertRaises(EPDConfigurationError, displayfactory.load_display_driver, constants.GOOD_EPD_NAME, config)
+
+        config['Display']['dither_engine'] = 'didder'
+        assert displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)._ditherer is None
+
+        # error diffusion is left to didder unless the builtin engine is required
+        config['Display'].update({'dither_engine': 'auto', 'dither_args': ''})
+        for serpentine in ('False', 'True'):
+            for dither, builtin in (('FloydSteinberg', False), ('Bayer', True), ('Random', True)):
+                config['Display'].update({'dither': dither, 'dither_serpentine': serpentine})
+                assert (displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)._ditherer is not None) == builtin
+
+        config['Display']['dither_engine'] = 'not_an_engine'
+        self.assertRaises(EPDConfigurationError, displayfactory.load_display_driver, constants.GOOD_EPD_NAME, config)
+
     def test_custom_dither(self):
         """
         Tests that custom dithering can be applied via either the INI file
@@ -118,3 +365,88 @@ class TestImageProcessing(unittest.TestCase):
 
         # compare the two images should be different (dither applied)
         assert not self.compare_images(constants.MOCK_EPD_OUTPUT, constants.MASTER_IMAGE)
+
+    def test_bands(self):
+        """
+        Test that processing an image in bands gives exactly the same result as the full image,
+        including the error carried between bands by error diffusion dithering
+        """
+        config = {'EPD': {'mode': 'palette', 'palette_filter': 'white, black, red'},
+                  'Display': {'rotate': '180', 'dither_engine': 'builtin'},
+                  'Image Enhancements': {'contrast': '1.5', 'gamma': '1.2', 'sharpness': '2'}}
+        image = self.open_image(constants.GALAXY_IMAGE, 60, 45)
+
+        for dither in ('FloydSteinberg', 'Stucki', 'Bayer'):
+            for serpentine in ('False', 'True'):
+                config['Display'].update({'dither': dither, 'dither_serpentine': serpentine, 'band_height': '0'})
+                epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+                epd.display(image)
+                expected = Image.open(constants.MOCK_EPD_OUTPUT)
+
+                for band_height in ('1', '7'):
+                    config['Display']['band_height'] = band_height
+                    epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+                    epd.display(image)
+
+                    assert ImageChops.difference(Image.open(constants.MOCK_EPD_OUTPUT), expected).getbbox() is None
+
+        # grey displays convert the image before it's rotated and flipped, the rest is still run in bands
+        config = {'EPD': {'mode': 'bw'},
+                  'Display': {'rotate': '90', 'flip_horizontal': 'True', 'dither': 'FloydSteinberg', 'dither_engine': 'builtin'}}
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+        assert [stage.name for stage in epd._pipeline][:2] == ['convert', 'transform']
+        epd.display(image)
+        expected = Image.open(constants.MOCK_EPD_OUTPUT)
+
+        config['Display']['band_height'] = '7'
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+
+        with mock.patch("omni_epd.virtualepd.run_bands", wraps=run_bands) as bands:
+            epd.display(image)
+
+        assert bands.call_count == 1
+        assert [stage.name for stage in bands.call_args.args[0]] == ['dither']
+        assert ImageChops.difference(Image.open(constants.MOCK_EPD_OUTPUT), expected).getbbox() is None
+
+        config['Display']['band_height'] = '-1'
+        self.assertRaises(EPDConfigurationError, displayfactory.load_display_driver, constants.GOOD_EPD_NAME, config)
+
+    def test_memory(self):
+        """
+        Test that displays that only show greys process images in L mode from the start, the dithering
+        arrays (traced by tracemalloc) then have one channel instead of three and use much less memory
+        """
+        image = self.open_image(constants.GALAXY_IMAGE, 400, 300).convert("RGB")
+        peaks = {}
+
+        for name, options in (('bw', {'mode': 'bw'}),
+                              ('grey', {'mode': 'palette', 'palette_filter': 'white, black, gray'}),
+                              ('color', {'mode': 'palette', 'palette_filter': 'white, black, red'})):
+            config = {'EPD': options, 'Display': {'dither': 'FloydSteinberg', 'dither_engine': 'builtin'},
+                      'Image Enhancements': {'contrast': '1.5'}}
+            epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+            assert (epd._pipeline[0].name == 'convert') == (name != 'color')
+
+            tracemalloc.start()
+            try:
+                epd.display(image)
+                peaks[name] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        assert peaks['bw'] * 2 < peaks['color']
+        assert peaks['grey'] * 2 < peaks['color']
+
+    def test_tricolor_planes(self):
+        """
+        Confirm the lookup tables split a 3 color image into the same black and color
+        planes as thresholding the greyscale image
+        """
+        palette = Palette([[255, 255, 255], [0, 0, 0], [255, 0, 0]])
+        image = self.open_image(constants.GALAXY_IMAGE, 400, 200).convert("RGB").quantize(palette=palette.image)
+        grey = image.convert("L")
+
+        black_table, color_table = tricolor_plane_tables(palette)
+
+        assert image.point(black_table, "1").tobytes() == grey.point(lambda p: 255 if p >= 20 else 0).convert("1").tobytes()
+        assert image.point(color_table, "1").tobytes() == grey.point(lambda p: 0 if 20 < p < 235 else 255).convert("1").tobytes()
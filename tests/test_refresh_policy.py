@@ -0,0 +1,117 @@
+import unittest
+from unittest import mock
+from PIL import Image, ImageDraw
+from . import constants as constants
+from omni_epd import displayfactory, EPDConfigurationError
+from omni_epd.refresh import RefreshPolicy, REFRESH_SKIP, REFRESH_PARTIAL, REFRESH_FULL
+
+SUPPORTED = (REFRESH_FULL, REFRESH_PARTIAL)
+
+
+class TestRefreshPolicy(unittest.TestCase):
+
+    def test_choose(self):
+        """
+        Confirm partial refreshes are used for small changes until a full refresh is needed
+        """
+        policy = RefreshPolicy(partial_update=True, partial_threshold=0.25, max_partial_updates=2)
+
+        # nothing is known about the display until the first full refresh
+        self.assertEqual(policy.choose(0.1, SUPPORTED), REFRESH_FULL)
+        policy.record(REFRESH_FULL)
+
+        self.assertEqual(policy.choose(0, SUPPORTED), REFRESH_SKIP)
+        self.assertEqual(policy.choose(None, SUPPORTED), REFRESH_FULL)
+        self.assertEqual(policy.choose(0.5, SUPPORTED), REFRESH_FULL)
+        self.assertEqual(policy.choose(0.1, (REFRESH_FULL, )), REFRESH_FULL)
+
+        for i in range(2):
+            self.assertEqual(policy.choose(0.1, SUPPORTED), REFRESH_PARTIAL)
+            policy.record(REFRESH_PARTIAL)
+
+        # too many partial refreshes
+        self.assertEqual(policy.choose(0.1, SUPPORTED), REFRESH_FULL)
+        policy.record(REFRESH_FULL)
+        self.assertEqual(policy.partial_count, 0)
+
+    def test_refresh_interval(self):
+        """
+        Confirm a full refresh is done once full_refresh_interval has passed
+        """
+        policy = RefreshPolicy(partial_update=True, full_refresh_interval=60)
+        policy.record(REFRESH_FULL)
+        self.assertEqual(policy.choose(0.1, SUPPORTED), REFRESH_PARTIAL)
+
+        policy.last_full -= 61
+        self.assertEqual(policy.choose(0.1, SUPPORTED), REFRESH_FULL)
+
+    def test_display_refresh(self):
+        """
+        Confirm display() uses the refresh picked by the policy
+        """
+        config = {"EPD": {"write_file": "False", "partial_update": "True", "max_partial_updates": "1"}}
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+        epd.refresh_types = SUPPORTED
+
+        image = Image.new("RGB", (epd.width, epd.height), "white")
+        changed = image.copy()
+        changed.paste("black", (0, 0, 10, 10))
+
+        with mock.patch.object(epd, "_display") as full, mock.patch.object(epd, "_display_partial") as partial:
+            self.assertTrue(epd.display(image))
+            self.assertTrue(epd.display(changed))
+            self.assertFalse(epd.display(changed))
+            self.assertTrue(epd.display(image))
+            self.assertTrue(epd.display(image, force=True))
+
+        self.assertEqual((full.call_count, partial.call_count), (3, 1))
+
+        # displays that only support full refreshes skip unchanged frames and draw the rest with a full refresh
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+
+        with mock.patch.object(epd, "_display") as full:
+            self.assertTrue(epd.display(image))
+            self.assertFalse(epd.display(image))
+            self.assertTrue(epd.display(changed))
+
+        self.assertEqual(full.call_count, 2)
+
+        # without partial_update every frame is drawn
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, {"EPD": {"write_file": "False"}})
+
+        with mock.patch.object(epd, "_display") as full:
+            self.assertTrue(epd.display(image))
+            self.assertTrue(epd.display(image))
+
+        self.assertEqual(full.call_count, 2)
+
+    def test_reused_image(self):
+        """
+        Confirm drawing on the image that was displayed and displaying it again isn't skipped
+        """
+        config = {"EPD": {"write_file": "False", "partial_update": "True"}}
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, config)
+        epd.refresh_types = SUPPORTED
+
+        image = Image.new("L", (epd.width, epd.height), 255)
+
+        with mock.patch.object(epd, "_display") as full, mock.patch.object(epd, "_display_partial") as partial:
+            self.assertTrue(epd.display(image))
+
+            ImageDraw.Draw(image).rectangle((0, 0, 10, 10), fill=0)
+            self.assertTrue(epd.display(image))
+
+        self.assertEqual((full.call_count, partial.call_count), (1, 1))
+
+    def test_invalid_options(self):
+        """
+        Confirm refresh options that can't be parsed or are out of range raise an error
+        """
+        for option, value in [("partial_update", "x"), ("partial_threshold", "-3"), ("partial_threshold", "1.5"),
+                              ("max_partial_updates", "x"), ("max_partial_updates", "-1"), ("full_refresh_interval", "-10")]:
+            with self.subTest(option=option, value=value):
+                config = {"EPD": {"write_file": "False", option: value}}
+                self.assertRaises(EPDConfigurationError, displayfactory.load_display_driver, constants.GOOD_EPD_NAME, config)
+
+        epd = displayfactory.load_display_driver(constants.GOOD_EPD_NAME, {"EPD": {"partial_threshold": "1", "max_partial_updates": "0"}})
+        self.assertEqual((epd._refresh_policy.partial_threshold, epd._refresh_policy.max_partial_updates), (1, 0))